@@ -1,17 +1,41 @@
+import os
+import json
+import asyncio
+import hmac
+import logging
 from typing import List
-from fastapi import FastAPI, Response
-from fastapi import BackgroundTasks, FastAPI
 from enum import Enum
-from pydantic import BaseModel, Field
-import joblib
-import numpy as np
-import pandas as pd
-import sqlite3
-from threading import Lock
-from sklearn.pipeline import Pipeline
-from prometheus_client import Histogram, Counter
-from prometheus_fastapi_instrumentator import Instrumentator, metrics
-from prometheus_fastapi_instrumentator.metrics import Info
+from predict_titanic_survival.startup import StartupTimer
+
+# Dauer der Imports und des Ladens der Artefakte wird als Metrik ausgegeben
+startup_timer = StartupTimer()
+with startup_timer.timed("import", "fastapi"):
+    from fastapi import FastAPI, Header, HTTPException, Request, Response
+    from fastapi.responses import StreamingResponse
+    from pydantic import BaseModel, Field, ValidationError
+    from starlette.concurrency import run_in_threadpool
+with startup_timer.timed("import", "numpy"):
+    import numpy as np
+with startup_timer.timed("import", "pandas"):
+    import pandas as pd
+with startup_timer.timed("import", "sklearn"):
+    import sklearn.pipeline # pylint: disable=unused-import
+with startup_timer.timed("import", "prometheus"):
+    from prometheus_client import Histogram, Counter, Gauge, CollectorRegistry, REGISTRY, \
+        CONTENT_TYPE_LATEST, generate_latest, multiprocess
+    from prometheus_fastapi_instrumentator import Instrumentator, metrics
+with startup_timer.timed("import", "predict_titanic_survival"):
+    from predict_titanic_survival.model_metrics import ModelOutputMetrics
+    from predict_titanic_survival.batching import MicroBatcher
+    from predict_titanic_survival.drift import DriftDetector, DriftWindow
+    from predict_titanic_survival.input_log import InputLogWriter
+    from predict_titanic_survival.explain import ExplainerPool
+    from predict_titanic_survival.cache import TTLCache, canonical_key
+    from predict_titanic_survival.artifacts import memory_usage
+    from predict_titanic_survival.registry import ModelBundle, activate_version, resolve_version
+    from predict_titanic_survival.schema import Input
+
+logger = logging.getLogger(__name__)
 
 NAMESPACE = "mlops"
 SUBSYSTEM = "model"
@@ -22,43 +46,11 @@ instrumentator.add(metrics.response_size(metric_namespace=NAMESPACE, metric_subs
 instrumentator.add(metrics.latency(metric_namespace=NAMESPACE, metric_subsystem=SUBSYSTEM))
 instrumentator.add(metrics.requests(metric_namespace=NAMESPACE, metric_subsystem=SUBSYSTEM))
 
-def model_output(metric_namespace: str = "", metric_subsystem: str = ""):
-    SCORE = Histogram(
-        "model_score",
-        "Predicted score of model",
-        buckets=(0, .1, .2, .3, .4, .5, .6, .7, .8, .9),
-        namespace=metric_namespace,
-        subsystem=metric_subsystem,
-    )
-    OUTLIER_SCORE = Histogram(
-        "outlier_score",
-        "Outlier score of data (shifted by +1.)",
-        buckets=np.round(np.arange(0,1.9, 0.1), 1),
-        namespace=metric_namespace,
-        subsystem=metric_subsystem,
-    )
-    LABEL = Counter(
-        "label",
-        "Predicted label",
-        namespace=metric_namespace,
-        subsystem=metric_subsystem,
-        labelnames=("label",)        
-    )
-
-    def instrumentation(info: Info) -> None:
-        if info.modified_handler == "/predict":
-            if info.response is not None:
-                model_score = info.response.headers.get("X-model-score")
-                model_label = info.response.headers.get("X-model-label")
-                outlier_score = info.response.headers.get("X-model-outlierscore")
-                if model_score:
-                    SCORE.observe(float(model_score))
-                    LABEL.labels(model_label).inc()
-                    OUTLIER_SCORE.observe(float(outlier_score)+1)
+# Modell-Ausgaben werden direkt beim Scoring erfasst
+model_output = ModelOutputMetrics(namespace=NAMESPACE, subsystem=SUBSYSTEM)
 
-    return instrumentation
-
-instrumentator.add(model_output(metric_namespace=NAMESPACE, metric_subsystem=SUBSYSTEM))
+# Score, Label und Outlier Score optional auch als Response-Header ausgeben
+model_output_headers = os.environ.get("MODEL_OUTPUT_HEADERS", "0") == "1"
 
 app = FastAPI(
     title="Titanic Survival Model API",
@@ -75,52 +67,140 @@ DRIFT_METRIC = Counter(
 )
 
 # Prometheus Instrumentator verknüpfen
-instrumentator.instrument(app).expose(app)
+instrumentator.instrument(app)
 
-model_path = "models/model.pkl"
-pipeline = joblib.load(model_path)
-preprocessor = Pipeline(pipeline.steps[:-1])
-classifier = pipeline.steps[-1][1]
-explainer = joblib.load("models/explainer.pkl")
-outlier_detector = joblib.load("models/outlier_detector.pkl")
-drift_detector = joblib.load("models/drift_detector.pkl")
+# Mit mehreren Worker-Prozessen (PROMETHEUS_MULTIPROC_DIR gesetzt, siehe
+# gunicorn.conf.py) werden die Metriken aller Prozesse zusammengefasst
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    metrics_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(metrics_registry)
+else:
+    metrics_registry = REGISTRY
 
-drift_lock = Lock()
+@app.get("/metrics")
+def expose_metrics():
+    return Response(generate_latest(metrics_registry), media_type=CONTENT_TYPE_LATEST)
+
+STARTUP_SECONDS = Gauge(
+    "startup_seconds",
+    "Duration of the startup steps (imports, loading artifacts, warm-up, readiness)",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("kind", "name"),
+    multiprocess_mode="max",
+)
+startup_timer.export(STARTUP_SECONDS)
+
+# Mit LAZY_LOADING=1 werden Explainer und Drift Detektor erst nach dem Start
+# im Hintergrund geladen, die API ist dann für /predict schneller bereit
+lazy_loading = os.environ.get("LAZY_LOADING", "0") == "1"
+
+WORKER_MEMORY = Gauge(
+    "worker_memory_bytes",
+    "Memory of the worker process (rss, pss, shared, private)",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("type",),
+    multiprocess_mode="all",
+)
+
+async def report_memory(interval: float = 15):
+    while True:
+        for memory_type, value in memory_usage().items():
+            WORKER_MEMORY.labels(memory_type).set(value)
+        await asyncio.sleep(interval)
+
+@app.on_event("startup")
+def start_memory_report():
+    app.state.memory_report = asyncio.create_task(report_memory())
+
+@app.on_event("shutdown")
+def stop_memory_report():
+    app.state.memory_report.cancel()
+
+# Mit ARTIFACT_MMAP_DIR werden die Numpy-Arrays der Artefakte als
+# Memory-Mapped Files geladen und von allen Prozessen gemeinsam genutzt
+artifact_mmap_dir = os.environ.get("ARTIFACT_MMAP_DIR")
+
+# Mit MODEL_REGISTRY_DIR werden die Artefakte aus der aktiven Version der
+# Registry geladen (siehe predict_titanic_survival/registry.py), sonst aus models/
+registry_dir = os.environ.get("MODEL_REGISTRY_DIR")
 
 # Ensure that both labels are observed from the start
 DRIFT_METRIC.labels(0).inc(0)
 DRIFT_METRIC.labels(1).inc(0)
 
-def detect_drift(df: pd.DataFrame):
-    with drift_lock:
-        con = sqlite3.connect("data/input_data.sqlite", timeout=15)
-        df.to_sql("Input", con, if_exists="append", index=False)
-        df = pd.read_sql("Select * FROM Input", con)
-        if len(df)>=100:
-            drift_pred = drift_detector.predict(df)
-            DRIFT_METRIC.labels(drift_pred).inc()
-            con.execute("DELETE FROM Input;")
-            con.commit()
-            con.close()
-
-class EmbarkedEnum(str, Enum):
-    cherbourg = 'C'
-    queenstown = 'Q'
-    southampton = 'S'
-    not_given = ''
-
-class Input(BaseModel):
-    pclass: int = Field(example=1, description="Passenger Class")
-    name: str = Field(example="Johanna, Miss. Smith", description="Passenger Name")
-    sex: str = Field(example="female", description="Sex")
-    age: float = Field(example=15.0, description="Age")
-    sibsp: int = Field(example=3, description="Number of Siblings/Spouses Aboard")
-    parch: int = Field(example=2, description="Number of Parents/Children Aboard")
-    ticket: str = Field(example="24160", description="Ticket Number")
-    fare: float = Field(example=211.3375, description="Passenger Fare")
-    cabin: str = Field(example="B5", description="Cabin")
-    embarked: EmbarkedEnum = Field(description="Port of Embarkation")
-    home_dest: str = Field(alias="home.dest", example="Montreal, PQ / Chesterville, ON", description="Heimat/Ziel")
+def make_drift_window(drift_detector: DriftDetector):
+    # Vorverarbeitete Eingaben werden im Speicher gesammelt und alle 100 Zeilen
+    # im Hintergrund auf Drift getestet
+    return DriftWindow(
+        drift_detector.predict_transformed,
+        n_features=drift_detector.n_features,
+        window_size=100,
+        on_result=lambda drift_pred: DRIFT_METRIC.labels(drift_pred).inc(),
+        snapshot_dir=os.environ.get("DRIFT_SNAPSHOT_DIR"),
+    )
+
+EXPLAIN_WAITING = Gauge(
+    "explain_waiting_requests",
+    "Explanation requests waiting for a free worker",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    multiprocess_mode="livesum",
+)
+EXPLAIN_RUNNING = Gauge(
+    "explain_running_requests",
+    "Explanation requests handed to the worker processes",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    multiprocess_mode="livesum",
+)
+
+def make_explainer_pool(model_path: str, explainer_path: str):
+    # Erklärungen werden in eigenen Prozessen berechnet, damit sie die
+    # Predictions nicht blockieren
+    return ExplainerPool(
+        model_path,
+        explainer_path,
+        max_workers=int(os.environ.get("EXPLAIN_WORKERS", "2")),
+        max_concurrency_per_worker=int(os.environ.get("EXPLAIN_MAX_CONCURRENCY_PER_WORKER", "1")),
+        on_change=lambda waiting, running: (EXPLAIN_WAITING.set(waiting), EXPLAIN_RUNNING.set(running)),
+        mmap_dir=artifact_mmap_dir,
+    )
+
+def load_bundle(version: str = None):
+    """Load the given version of the registry (default: the active
+    one), or the artifacts in models/ without a registry."""
+    if registry_dir is None:
+        directory = "models"
+    else:
+        version = version or resolve_version(registry_dir)
+        if version is None:
+            raise FileNotFoundError(f"No model version in {registry_dir}")
+        directory = os.path.join(registry_dir, version)
+    return ModelBundle(
+        directory,
+        make_drift_window,
+        make_explainer_pool,
+        version=version,
+        mmap_dir=artifact_mmap_dir,
+        timer=startup_timer,
+    )
+
+# Alle Anfragen verwenden das aktive Bundle, das beim Neuladen als Ganzes
+# ausgetauscht wird
+bundle = load_bundle()
+if not lazy_loading:
+    bundle.drift.get()
+
+@app.on_event("startup")
+def load_drift_monitoring_in_background():
+    if not bundle.drift.loaded:
+        bundle.drift.load_in_background()
+
+@app.on_event("shutdown")
+def close_bundle():
+    bundle.close()
 
 # Datenmodell für Ausgabe
 class Prediction(BaseModel):
@@ -134,29 +214,485 @@ class Contribution(BaseModel):
 class Explanation(BaseModel):
     contributions: List[Contribution]
 
+class ExplainMethod(str, Enum):
+    lime = "lime"
+    tree = "tree"
+
+class BatchPrediction(BaseModel):
+    predictions: List[Prediction]
+    outlier_scores: List[float] = Field(description="Outlier score per input (clipped at -2)")
+
+INPUT_COLUMNS = [field.alias for field in Input.__fields__.values()]
+
+INPUT_LOG_PENDING = Gauge(
+    "input_log_pending_rows",
+    "Input rows waiting to be written to the input log",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    multiprocess_mode="livesum",
+)
+INPUT_LOG_DROPPED = Counter(
+    "input_log_dropped_rows",
+    "Input rows dropped because the input log queue was full",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+)
+INPUT_LOG_WRITTEN = Counter(
+    "input_log_written_rows",
+    "Input rows written to the input log",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+)
+INPUT_LOG_FLUSH = Histogram(
+    "input_log_flush_seconds",
+    "Duration of writing one batch to the input log",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+)
+
+def record_input_log_flush(n_rows, seconds):
+    INPUT_LOG_WRITTEN.inc(n_rows)
+    INPUT_LOG_FLUSH.observe(seconds)
+
+# Eingaben werden von einem eigenen Thread gesammelt in die SQLite-Datenbank
+# geschrieben (WAL, ein Commit je Batch)
+input_log = InputLogWriter(
+    "data/input_data.sqlite",
+    INPUT_COLUMNS,
+    batch_size=int(os.environ.get("INPUT_LOG_BATCH_SIZE", "500")),
+    flush_interval=float(os.environ.get("INPUT_LOG_FLUSH_MS", "200"))/1000,
+    max_pending=int(os.environ.get("INPUT_LOG_MAX_PENDING", "100000")),
+    on_flush=record_input_log_flush,
+    on_pending=INPUT_LOG_PENDING.set,
+)
+
+@app.on_event("startup")
+def start_input_log():
+    input_log.start()
+
+@app.on_event("shutdown")
+def close_input_log():
+    input_log.close()
+
+def monitor_inputs(bundle: ModelBundle, rows: List[tuple], X_drift: np.ndarray):
+    """Add the inputs to the input log and their preprocessed
+    rows to the drift window of `bundle` (unless `X_drift` is None
+    because the drift detector is not loaded yet)."""
+    if not input_log.log(rows):
+        INPUT_LOG_DROPPED.inc(len(rows))
+    if X_drift is not None:
+        bundle.drift.get().window.add(X_drift)
+
+def score_batch(bundle: ModelBundle, df: pd.DataFrame):
+    """Score all rows of `df` with the model of `bundle` in one
+    vectorized call and return labels, scores, outlier scores and
+    the rows preprocessed for the drift detection as arrays. The
+    inputs are monitored with `monitor_inputs`, the outputs
+    recorded in `model_output`."""
+    X_tf = bundle.preprocessor.transform(df)
+    pred_probas = bundle.classifier.predict_proba(X_tf)
+    if bundle.share_preprocessing:
+        decision = bundle.outlier_detector.detector.decision_function(X_tf)
+    else:
+        decision = bundle.outlier_detector.decision_function(df)
+    if not bundle.drift.loaded:
+        X_drift = None
+    elif bundle.drift.get().share_preprocessing:
+        X_drift = X_tf
+    else:
+        X_drift = bundle.drift.get().detector.preprocessor.transform(df)
+    monitor_inputs(bundle, list(df[INPUT_COLUMNS].itertuples(index=False, name=None)), X_drift)
+    labels = np.argmax(pred_probas, axis=1)
+    scores = pred_probas[np.arange(len(df)), labels]
+    outlier_scores = np.maximum(-2, decision/2)
+    model_output.observe(labels, scores, outlier_scores)
+    return labels, scores, outlier_scores, X_drift
+
+def score_records(records: List[dict]):
+    """Score a list of input records with the active bundle and return
+    one (label, score, outlier score, drift row, version) tuple per record."""
+    scoring_bundle = bundle
+    labels, scores, outlier_scores, X_drift = score_batch(scoring_bundle, pd.DataFrame(records))
+    if X_drift is None:
+        X_drift = [None] * len(records)
+    return [result + (scoring_bundle.version,) for result in zip(labels, scores, outlier_scores, X_drift)]
+
+def example_input():
+    example = {name: prop["example"] for name, prop in Input.schema()["properties"].items()}
+    return pd.DataFrame([example])
+
+with startup_timer.timed("warmup", "model"):
+    # Erste Anfrage soll nicht langsamer sein
+    bundle.warm_up(example_input())
+
+CACHE_HITS = Counter(
+    "cache_hits",
+    "Responses served from the cache",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("cache",),
+)
+CACHE_MISSES = Counter(
+    "cache_misses",
+    "Responses not found in the cache",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("cache",),
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions",
+    "Cache entries evicted because the cache was full or the entry expired",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("cache",),
+)
+
+def create_cache(name: str, default_size: str, default_ttl: str):
+    return TTLCache(
+        maxsize=int(os.environ.get(f"{name.upper()}_CACHE_SIZE", default_size)),
+        ttl=float(os.environ.get(f"{name.upper()}_CACHE_TTL_S", default_ttl)),
+        version=bundle.fingerprint,
+        on_hit=CACHE_HITS.labels(name).inc,
+        on_miss=CACHE_MISSES.labels(name).inc,
+        on_evict=CACHE_EVICTIONS.labels(name).inc,
+    )
+
+# Wiederholte Eingaben werden aus dem Cache beantwortet. Die Einträge gehören
+# zu den geladenen Artefakten und verfallen, wenn diese ausgetauscht werden.
+predict_cache = create_cache("predict", "10000", "300")
+explain_cache = create_cache("explain", "1000", "3600")
+
+# Optionales Micro-Batching: gleichzeitige Anfragen an /predict werden
+# gesammelt und gemeinsam bewertet
+micro_batcher = None
+if os.environ.get("MICRO_BATCHING", "0") == "1":
+    micro_batcher = MicroBatcher(
+        score_records,
+        max_batch_size=int(os.environ.get("MICRO_BATCH_MAX_SIZE", "64")),
+        max_wait=float(os.environ.get("MICRO_BATCH_MAX_WAIT_MS", "2"))/1000,
+    )
+
+    @app.on_event("startup")
+    def start_micro_batcher():
+        micro_batcher.start()
+
+    @app.on_event("shutdown")
+    async def stop_micro_batcher():
+        await micro_batcher.stop()
+
 # Endpunkt für Prediction
 @app.post('/predict', response_model=Prediction)
-def predict(response: Response, input: Input, background_tasks: BackgroundTasks):
-    df = pd.DataFrame([input.dict(by_alias=True)])
-    background_tasks.add_task(detect_drift, df)
-    pred_probas = pipeline.predict_proba(df)[0]
-    survival = np.argmax(pred_probas)
-    prediction = Prediction(label=survival, score=pred_probas[survival])
-    response.headers["X-model-score"] = str(prediction.score)
-    response.headers["X-model-label"] = str(prediction.label)
-    response.headers["X-model-outlierscore"] = str(max(-2, outlier_detector.decision_function(df)[0]/2))
+async def predict(response: Response, input: Input):
+    record = input.dict(by_alias=True)
+    key = canonical_key(record, bundle.version)
+    cached = predict_cache.get(key)
+    if cached is not None:
+        # Auch gecachte Eingaben werden geloggt und auf Drift getestet
+        label, score, outlier_score, drift_row, version = cached
+        monitor_inputs(bundle, [tuple(record[column] for column in INPUT_COLUMNS)], drift_row[None, :])
+        model_output.observe([label], [score], [outlier_score])
+    else:
+        if micro_batcher is not None:
+            result = await micro_batcher.submit(record)
+        else:
+            result = (await run_in_threadpool(score_records, [record]))[0]
+        label, score, outlier_score, drift_row, version = result
+        # Ohne Drift-Zeile (Drift Detektor noch nicht geladen) nicht cachen
+        if drift_row is not None:
+            predict_cache.set(key, result)
+    prediction = Prediction(label=label, score=score)
+    response.headers["X-model-version"] = version
+    if model_output_headers:
+        response.headers["X-model-score"] = str(prediction.score)
+        response.headers["X-model-label"] = str(prediction.label)
+        response.headers["X-model-outlierscore"] = str(outlier_score)
     return prediction
 
+# Endpunkt für Batch-Prediction
+@app.post('/predict_batch', response_model=BatchPrediction)
+def predict_batch(response: Response, inputs: List[Input]):
+    scoring_bundle = bundle
+    response.headers["X-model-version"] = scoring_bundle.version
+    if not inputs:
+        return BatchPrediction(predictions=[], outlier_scores=[])
+    df = pd.DataFrame([input.dict(by_alias=True) for input in inputs])
+    labels, scores, outlier_scores, _ = score_batch(scoring_bundle, df)
+    return BatchPrediction(
+        predictions=[Prediction(label=label, score=score) for label, score in zip(labels, scores)],
+        outlier_scores=outlier_scores.tolist(),
+    )
+
+# Streaming-Endpunkt für große Datenmengen: Eingaben als NDJSON (eine Zeile je
+# Passagier) werden gelesen, während sie ankommen, und in Chunks von
+# PREDICT_STREAM_CHUNK_SIZE Zeilen bewertet. Die Ergebnisse werden als NDJSON
+# zurückgestreamt, so bleibt der Speicher unabhängig von der Größe der Anfrage.
+stream_chunk_size = int(os.environ.get("PREDICT_STREAM_CHUNK_SIZE", "1000"))
+MAX_STREAM_LINE_BYTES = 64 * 1024
+
+class RequestStreamingResponse(StreamingResponse):
+    """Streaming response whose content is produced while reading the
+    request body, which must therefore not be consumed by listening
+    for the disconnect of the client."""
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def ndjson_lines(stream):
+    """Split the chunks of `stream` into non-empty lines and yield them
+    with their line numbers (counted from 1). Lines longer than
+    `MAX_STREAM_LINE_BYTES` are not kept and yielded as None."""
+    buffer = b""
+    line_no = 0
+    too_long = False
+    async for data in stream:
+        lines = (buffer + data).split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_no += 1
+            if too_long or line.strip():
+                yield line_no, None if too_long else line
+            too_long = False
+        if len(buffer) > MAX_STREAM_LINE_BYTES:
+            too_long = True
+            buffer = b""
+    if too_long or buffer.strip():
+        yield line_no + 1, None if too_long else buffer
+
+def score_stream_chunk(bundle: ModelBundle, lines: List[tuple]):
+    """Validate and score the (line number, line) pairs of one chunk and
+    return the NDJSON result lines in the same order. Invalid lines are
+    reported with their validation errors."""
+    records = []
+    errors = {}
+    for line_no, line in lines:
+        if line is None:
+            errors[line_no] = [{"msg": f"line longer than {MAX_STREAM_LINE_BYTES} bytes"}]
+            continue
+        try:
+            records.append(Input.parse_raw(line).dict(by_alias=True))
+        except ValidationError as error:
+            errors[line_no] = json.loads(error.json())
+    if records:
+        results = zip(*score_batch(bundle, pd.DataFrame(records))[:3])
+    output = []
+    for line_no, _ in lines:
+        if line_no in errors:
+            output.append({"line": line_no, "errors": errors[line_no]})
+        else:
+            label, score, outlier_score = next(results)
+            output.append({"line": line_no, "label": int(label), "score": float(score),
+                           "outlier_score": float(outlier_score)})
+    return "".join(json.dumps(result) + "\n" for result in output)
+
+@app.post('/predict_stream')
+async def predict_stream(request: Request):
+    scoring_bundle = bundle
+
+    async def results():
+        chunk = []
+        async for line_no, line in ndjson_lines(request.stream()):
+            chunk.append((line_no, line))
+            if len(chunk) == stream_chunk_size:
+                yield await run_in_threadpool(score_stream_chunk, scoring_bundle, chunk)
+                chunk = []
+        if chunk:
+            yield await run_in_threadpool(score_stream_chunk, scoring_bundle, chunk)
+
+    return RequestStreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"X-model-version": scoring_bundle.version},
+    )
+
+class RouterBypassMiddleware:
+    """Serves the requests to `paths` directly by the router of the app,
+    bypassing the other middleware. The HTTP middleware of the
+    instrumentator listens for the disconnect of the client while
+    streaming the response and would consume the request body of a
+    streaming endpoint."""
+    def __init__(self, app, router, paths):
+        self.app = app
+        self.router = router
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            await self.router(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+app.add_middleware(RouterBypassMiddleware, router=app.router, paths={"/predict_stream"})
+
+async def record_explainer_load():
+    await bundle.explainer_pool.wait_ready()
+    startup_timer.record("artifact", "explainer.pkl", bundle.explainer_pool.load_seconds)
+
+@app.on_event("startup")
+async def start_explainer_pool():
+    await bundle.explainer_pool.start(wait=not lazy_loading)
+    app.state.explainer_load = asyncio.create_task(record_explainer_load())
+
+def explain_tree(bundle: ModelBundle, record: dict):
+    # Exakte Erklärung über die Bäume des Modells (TreeSHAP), falls das Modell
+    # ein Gradient Boosting Classifier ist
+    X_tf = bundle.preprocessor.transform(pd.DataFrame([record]))
+    return bundle.tree_explainer.explain(X_tf[0])
+
 @app.post('/explain', response_model=Explanation)
-async def explain(input: Input):
-    df = pd.DataFrame([input.dict(by_alias=True)])
-    X_tf = preprocessor.transform(df)
-    explanation = explainer.explain_instance(X_tf[0], classifier.predict_proba)
+async def explain(response: Response, input: Input, method: ExplainMethod = ExplainMethod.lime):
+    explaining_bundle = bundle
+    if method == ExplainMethod.tree and explaining_bundle.tree_explainer is None:
+        raise HTTPException(status_code=400, detail="Tree explanations are not supported by the model")
+    record = input.dict(by_alias=True)
+    key = canonical_key(record, method.value, explaining_bundle.version)
+    contributions = explain_cache.get(key)
+    if contributions is None:
+        if method == ExplainMethod.tree:
+            contributions = await run_in_threadpool(explain_tree, explaining_bundle, record)
+        else:
+            contributions = await explaining_bundle.explainer_pool.submit(record)
+        explain_cache.set(key, contributions)
+    response.headers["X-model-version"] = explaining_bundle.version
     return Explanation(contributions=[
-        Contribution(characteristic=char, contribution=contrib) for char, contrib in explanation.as_list()
+        Contribution(characteristic=char, contribution=contrib) for char, contrib in contributions
         ]
     )
 
+MODEL_VERSION = Gauge(
+    "version",
+    "Worker processes serving the model version",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("version",),
+    multiprocess_mode="livesum",
+)
+MODEL_RELOADS = Counter(
+    "reloads",
+    "Attempts to load a new model version",
+    namespace=NAMESPACE,
+    subsystem=SUBSYSTEM,
+    labelnames=("result",),
+)
+
+# Alte Bundles werden erst nach einer Karenzzeit geschlossen, damit laufende
+# Anfragen (z.B. Erklärungen) noch beantwortet werden
+reload_grace_period = float(os.environ.get("MODEL_RELOAD_GRACE_S", "30"))
+
+retired_bundles = set()
+background_tasks = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def close_later(old_bundle: ModelBundle):
+    await asyncio.sleep(reload_grace_period)
+    retired_bundles.discard(old_bundle)
+    await run_in_threadpool(old_bundle.close)
+
+async def reload_bundle(version: str):
+    """Load `version` in the background, warm it up and swap it in as
+    the active bundle. Requests keep using the previous bundle until the
+    swap; on failure it stays active."""
+    global bundle # pylint: disable=global-statement
+    async with app.state.reload_lock:
+        if version == bundle.version:
+            return
+        new_bundle = None
+        try:
+            new_bundle = await run_in_threadpool(load_bundle, version)
+            await run_in_threadpool(new_bundle.warm_up, example_input())
+            await run_in_threadpool(new_bundle.drift.get)
+            await new_bundle.explainer_pool.start(wait=True)
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Loading model version %s failed", version)
+            MODEL_RELOADS.labels("error").inc()
+            if new_bundle is not None:
+                await run_in_threadpool(new_bundle.close)
+            return
+        old_bundle, bundle = bundle, new_bundle
+        predict_cache.set_version(new_bundle.fingerprint)
+        explain_cache.set_version(new_bundle.fingerprint)
+        MODEL_VERSION.labels(new_bundle.version).set(1)
+        MODEL_VERSION.labels(old_bundle.version).set(0)
+        MODEL_RELOADS.labels("success").inc()
+        logger.info("Activated model version %s", new_bundle.version)
+        retired_bundles.add(old_bundle)
+        run_in_background(close_later(old_bundle))
+
+async def watch_registry(interval: float):
+    # Jeder Worker-Prozess prüft selbst, ob eine andere Version aktiv ist
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            version = resolve_version(registry_dir)
+        except OSError:
+            logger.exception("Reading the model registry failed")
+            continue
+        if version is not None and version != bundle.version:
+            await reload_bundle(version)
+
+@app.on_event("startup")
+def start_registry_watch():
+    # Erst im Worker-Prozess setzen, nicht im Master (PRELOAD_APP)
+    MODEL_VERSION.labels(bundle.version).set(1)
+    # Lock erst in der Event-Loop des Workers erzeugen, nicht beim Import
+    # (unter Python 3.8 wäre er sonst an eine andere Loop gebunden)
+    app.state.reload_lock = asyncio.Lock()
+    if registry_dir is not None:
+        app.state.registry_watch = asyncio.create_task(
+            watch_registry(float(os.environ.get("MODEL_WATCH_INTERVAL_S", "5"))))
+
+@app.on_event("shutdown")
+async def stop_registry_watch():
+    if registry_dir is not None:
+        app.state.registry_watch.cancel()
+    for task in list(background_tasks):
+        task.cancel()
+    # Bundles in der Karenzzeit sofort schließen
+    for old_bundle in list(retired_bundles):
+        old_bundle.close()
+
+# Version über die API aktivieren, nur wenn ADMIN_TOKEN gesetzt ist und mit
+# passendem X-Admin-Token Header. Die Version wird in der Registry aktiviert,
+# damit alle Worker-Prozesse sie übernehmen.
+admin_token = os.environ.get("ADMIN_TOKEN")
+
+@app.post('/admin/activate', status_code=202)
+async def activate(version: str, x_admin_token: str = Header(default=None)):
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin API disabled, ADMIN_TOKEN is not set")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if registry_dir is None:
+        raise HTTPException(status_code=404, detail="No model registry configured")
+    try:
+        activate_version(registry_dir, version)
+    except ValueError as error:
+        raise HTTPException(status_code=404, detail=str(error)) from error
+    run_in_background(reload_bundle(version))
+    return {"version": version}
+
+# Bereit, sobald das Modell geladen und aufgewärmt ist. Explainer und Drift
+# Detektor können bei LAZY_LOADING=1 noch im Hintergrund geladen werden.
+app.state.ready = False
+
+@app.on_event("startup")
+def mark_ready():
+    app.state.ready = True
+    startup_timer.record("ready", "predict", startup_timer.since_start())
+
+@app.get("/ready")
+def ready(response: Response):
+    if not app.state.ready:
+        response.status_code = 503
+    return {
+        "predict": app.state.ready,
+        "explain": bundle.explainer_pool.ready,
+        "drift": bundle.drift.loaded,
+        "version": bundle.version,
+    }
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,44 @@
+"""
+Configuration for serving the model API with several worker processes:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The number of workers is set with WEB_CONCURRENCY (default 1). The
+Prometheus metrics of all workers are written to PROMETHEUS_MULTIPROC_DIR
+and aggregated on /metrics.
+
+The app is loaded once in the master process and the workers are forked
+from it (set PRELOAD_APP=0 to load it in each worker instead). The numpy
+arrays of the artifacts are memory-mapped from ARTIFACT_MMAP_DIR, so the
+workers and the explanation processes share them.
+"""
+
+import glob
+import os
+
+# Has to be set before prometheus_client is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+os.environ.setdefault("ARTIFACT_MMAP_DIR", "/tmp/model_artifacts")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+def on_starting(server):
+    # Metrics of previous runs must not be added to the new ones. Only called
+    # once, not when the configuration is reloaded (SIGHUP). The preloaded app
+    # has already written the metrics of the master process, they are kept.
+    # A master started for an upgrade (USR2) runs next to the old one.
+    if server.master_pid:
+        return
+    own_suffix = f"_{server.pid}.db"
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        if not path.endswith(own_suffix):
+            os.remove(path)
+
+def child_exit(server, worker):
+    # Remove the live gauges of the dead worker, its counters are kept
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# ---
+# jupyter:
+#   jupytext:
+#     formats: ipynb,py:percent
+#     text_representation:
+#       extension: .py
+#       format_name: percent
+#       format_version: '1.3'
+#       jupytext_version: 1.14.4
+#   kernelspec:
+#     display_name: Python 3 (ipykernel)
+#     language: python
+#     name: python3
+# ---
+
+# %% [markdown]
+# # Benchmark KNN Imputer
+#
+# At prediction time the `KNNImputer` computes the distances of each row with a missing value to all stored training rows. The `IndexedKNNImputer` looks up the neighbours in KD-trees built at fit time. This notebook compares the latency of both for growing training sets.
+
+# %%
+import time
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from sklearn.impute import KNNImputer
+
+# %%
+import sys
+sys.path.append("../")
+from predict_titanic_survival.impute import IndexedKNNImputer
+
+
+# %% [markdown]
+# Synthetic data with the same columns as the input of the `impute` step (`sibsp`, `parch`, `fare`, `age`, `embarked`, `sex`, `pclass`), where `age` is missing for about 20 % and `fare` for about 0.1 % of the passengers, as in the Titanic data.
+
+# %%
+def sample(n, random_state):
+    rng = np.random.RandomState(random_state)
+    X = np.c_[
+        rng.poisson(.5, n),
+        rng.poisson(.4, n),
+        np.round(rng.lognormal(2.8, 1., n), 4),
+        np.round(rng.gamma(4, 7.5, n)),
+        rng.randint(0, 4, n),
+        rng.randint(0, 2, n),
+        rng.randint(0, 3, n),
+    ].astype(float)
+    X[rng.rand(n) < .2, 3] = np.nan
+    X[rng.rand(n) < .001, 2] = np.nan
+    return X
+
+
+# %% [markdown]
+# Requests with missing `age` are scored one at a time, as in the model API.
+
+# %%
+X_request = sample(200, random_state=1)
+X_request[:, 3] = np.nan
+
+
+def latency(imputer, X):
+    start = time.perf_counter()
+    for row in X:
+        imputer.transform(row[None, :])
+    return (time.perf_counter() - start) / len(X) * 1000
+
+
+# %%
+results = []
+for n_train in [1_000, 5_000, 20_000, 100_000]:
+    X_train = sample(n_train, random_state=0)
+    knn = KNNImputer().fit(X_train)
+    indexed = IndexedKNNImputer().fit(X_train)
+    differing = ~np.isclose(indexed.transform(X_request), knn.transform(X_request), rtol=1e-12, atol=1e-12)
+    results.append({
+        "n_train": n_train,
+        "KNNImputer [ms]": latency(knn, X_request),
+        "IndexedKNNImputer [ms]": latency(indexed, X_request),
+        "differing values": int(differing.sum()),
+    })
+results = pd.DataFrame(results).set_index("n_train")
+results
+
+# %%
+ax = results.plot(logx=True, logy=True, marker="o")
+ax.set_xlabel("Training rows")
+ax.set_ylabel("Latency per request [ms]")
+
+# %% [markdown]
+# The latency of the `IndexedKNNImputer` hardly depends on the number of training rows. Rows whose 5th and 6th neighbour have the same distance are still imputed with the distances to all training rows, because the choice among tied neighbours cannot be reproduced otherwise. Many exact duplicates in the training data therefore reduce the gain.
+#
+# The `IndexedKNNImputer` uses exactly computed distances. `KNNImputer` computes them with matrix products, whose rounding error depends on the BLAS, so where two donors are about equally far it may pick the other one (`differing values`).
@@ -21,13 +21,15 @@
 import pandas as pd
 import numpy as np
 import sys
+sys.path.append("..")
+from predict_titanic_survival.dataset import load_dataset
 
 # %% [markdown]
 # ## Read data
 # Prepared data is read.
 
 # %%
-test_df = pd.read_pickle("../data/interim/test_df.pkl")
+test_df = load_dataset("../data/interim/test_df.arrow")
 
 # %%
 test_df.head()
@@ -73,13 +75,28 @@ for idx, row in test_df.drop(columns="label").sample(100).iterrows():
 # %%
 test_df[pd.notna(test_df["survival"])]
 
+# %% [markdown]
+# ## Batch scoring
+#
+# Larger amounts of data should not be sent row by row. The endpoint `/predict_batch` scores a list of inputs in one call.
+
+# %%
+from titanic_survival_model_api_client.api.default import predict_batch_predict_batch_post
+
+batch_df = test_df.drop(columns=["label", "survival"])
+inputs = [Input.from_dict(row) for _, row in batch_df.iterrows()]
+batch_prediction = predict_batch_predict_batch_post.sync(client=client, json_body=inputs)
+test_df["survival_batch"] = [prediction.label for prediction in batch_prediction.predictions]
+test_df["outlier_score"] = batch_prediction.outlier_scores
+test_df.head()
+
 # %% [markdown]
 # ## Outlier
 #
 # Now call the API on a test basis with the Outlier dataset (passengers aged 50 and over).
 
 # %%
-outlier_df = pd.read_pickle("../data/interim/outlier_df.pkl")
+outlier_df = load_dataset("../data/interim/outlier_df.arrow")
 # Loop über zufällige Zeilen des DataFrames
 for idx, row in outlier_df[(outlier_df["fare"].notna()) & (outlier_df["embarked"].notna())].drop(columns="label").sample(100).iterrows():
     
@@ -90,3 +107,33 @@ for idx, row in outlier_df[(outlier_df["fare"].notna()) & (outlier_df["embarked"
     prediction = predict_predict_post.sync(client=client, json_body=input)
 
 # %%
+
+# %% [markdown]
+# ## Load test
+#
+# The loops above only send one request at a time. To measure throughput and tail latency, the test data is written as payloads to a JSONL file and replayed with many concurrent clients (see `predict_titanic_survival/loadtest.py`, also usable from the command line).
+
+# %%
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from predict_titanic_survival.loadtest import read_payloads, run_load_test, write_payloads
+
+payload_path = "../data/load_test/payloads.jsonl"
+os.makedirs(os.path.dirname(payload_path), exist_ok=True)
+if os.path.exists(payload_path):
+    os.remove(payload_path)
+payload_df = test_df.drop(columns=["label", "survival", "survival_batch", "outlier_score"])
+payload_df = payload_df.astype({"sex": object, "embarked": object})
+payload_df = payload_df.fillna({"age": payload_df["age"].median(), "fare": payload_df["fare"].median()}).fillna("")
+write_payloads(payload_df.to_dict(orient="records"), payload_path)
+
+# %%
+# Eigener Thread mit eigener Event Loop, da in Jupyter bereits eine Event Loop läuft
+with ThreadPoolExecutor(max_workers=1) as executor:
+    load_report = executor.submit(asyncio.run, run_load_test(
+        "http://127.0.0.1:8080", read_payloads(payload_path), concurrency=16, duration=10)).result()
+pd.DataFrame({path: stats["latency_ms"] for path, stats in load_report["paths"].items()})
+
+# %%
+{key: value for key, value in load_report["total"].items() if key != "latency_ms"}
@@ -16,7 +16,7 @@
 # %% [markdown]
 # # Drift Detector
 # ```
-# dvc run -n drift_model --force -w notebooks -d ../data/interim/train_df.pkl -d ../data/interim/test_df.pkl -d ../data/interim/outlier_df.pkl -d ../models/model.pkl -d ../models/feat_names.json -o ../models/drift_detector.pkl python drift_detector.pct.py
+# dvc run -n drift_model --force -w notebooks -d ../data/interim/train_df.arrow -d ../data/interim/test_df.arrow -d ../data/interim/outlier_df.arrow -d ../models/model.pkl -d ../models/feat_names.json -o ../models/drift_detector.pkl python drift_detector.pct.py
 # ```
 
 # %%
@@ -27,17 +27,22 @@ import pandas as pd
 import json
 import joblib
 import cloudpickle
-from scipy.stats import chi2_contingency, ks_2samp
 
 from sklearn.pipeline import Pipeline
 from joblib import load
 
+# %%
+import sys
+sys.path.append("../")
+from predict_titanic_survival.drift import DriftDetector
+from predict_titanic_survival.dataset import load_dataset
+
 # %% [markdown]
 # Daten laden
 
 # %%
-train_df = pd.read_pickle("../data/interim/train_df.pkl")
-test_df = pd.read_pickle("../data/interim/test_df.pkl")
+train_df = load_dataset("../data/interim/train_df.arrow")
+test_df = load_dataset("../data/interim/test_df.arrow")
 X_train = train_df.drop(columns=["label"])
 X_valid = test_df.drop(columns=["label"])
 X_train.tail()
@@ -65,41 +70,30 @@ categorical_names={
 }
 
 
-# %%
-class DriftDetector:
-    def __init__(self, X_train, preprocessor, feat_names, categorical_features):
-        self.preprocessor = preprocessor
-        self.X_train = self._preprocess(X_train)
-        self.feat_names = feat_names
-        self.categorical_features = categorical_features
-        self.p_value = 0.5
-    
-    def _preprocess(self, X):
-        return self.preprocessor.transform(X)
-    
-    def test(self, X):
-        X = self._preprocess(X)
-        p_values = []
-        for feat in range(self.X_train.shape[1]):
-            if feat not in self.categorical_features:
-                p_values.append(ks_2samp(self.X_train[:, feat], X[:, feat]).pvalue)
-            else:
-                p_values.append( 
-                      chi2_contingency(np.vstack([np.bincount(self.X_train[:, feat].astype(int)), 
-                                                 np.bincount(X[:, feat].astype(int))]))[1])
-        return p_values
-    def predict(self, X):
-        threshold = self.p_value / self.X_train.shape[1]
-        drift_pred = int((np.array(self.test(X)) < threshold).any())
-        return drift_pred
-
-
 # %%
 dd = DriftDetector(X_train, preprocessor, feat_names, categorical_features)
 
 # %%
 dd.test(X_valid)
 
+# %% [markdown]
+# The detector keeps the sorted training columns and the category counts instead of the training data. The p-values are the same as when each feature is tested with scipy directly:
+
+# %%
+from scipy.stats import chi2_contingency, ks_2samp
+X_train_tf = preprocessor.transform(X_train)
+X_valid_tf = preprocessor.transform(X_valid)
+p_values = []
+for feat in range(X_train_tf.shape[1]):
+    if feat not in categorical_features:
+        p_values.append(ks_2samp(X_train_tf[:, feat], X_valid_tf[:, feat]).pvalue)
+    else:
+        n_categories = int(max(X_train_tf[:, feat].max(), X_valid_tf[:, feat].max())) + 1
+        table = np.vstack([np.bincount(X_train_tf[:, feat].astype(int), minlength=n_categories),
+                           np.bincount(X_valid_tf[:, feat].astype(int), minlength=n_categories)])
+        p_values.append(chi2_contingency(table[:, table.sum(axis=0) > 0])[1])
+assert p_values == dd.test(X_valid)
+
 # %%
 0.5 / X_train.shape[1]
 
@@ -107,7 +101,7 @@ dd.test(X_valid)
 dd.predict(X_valid)
 
 # %%
-outlier_df = pd.read_pickle("../data/interim/outlier_df.pkl")
+outlier_df = load_dataset("../data/interim/outlier_df.arrow")
 list(zip(feat_names, dd.test(outlier_df[~outlier_df["fare"].isna()].drop(columns=["label"]))))
 
 # %%
@@ -19,7 +19,7 @@
 #
 # Run the DVC pipeline with the following command:
 # ```
-# dvc run -n load_data --force -o ../data/interim/train_df.pkl -o ../data/interim/test_df.pkl -o ../data/interim/outlier_df.pkl -d load_data.pct.py -w notebooks python load_data.pct.py
+# dvc run -n load_data --force -o ../data/interim/train_df.arrow -o ../data/interim/test_df.arrow -o ../data/interim/outlier_df.arrow -d load_data.pct.py -w notebooks python load_data.pct.py
 # ```
 
 # %%
@@ -27,6 +27,9 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import sys
+sys.path.append("../")
+from predict_titanic_survival.dataset import save_dataset
 
 # %%
 from sklearn.model_selection import train_test_split
@@ -96,12 +99,12 @@ len(train_df), len(test_df)
 # %% [markdown]
 # ## Save data
 #
-# The DataFrames are output as a pickle.
+# The DataFrames are written as uncompressed Arrow files with compact dtypes (categories for `sex` and `embarked`, small integers for `pclass`, `sibsp`, `parch` and `label`). They can be memory-mapped, so later stages only read the columns they use (see `predict_titanic_survival/dataset.py`).
 
 # %%
 os.makedirs("../data/interim", exist_ok=True)
 
 # %%
-train_df.to_pickle("../data/interim/train_df.pkl")
-test_df.to_pickle("../data/interim/test_df.pkl")
-outlier_df.to_pickle("../data/interim/outlier_df.pkl")
+save_dataset(train_df, "../data/interim/train_df.arrow")
+save_dataset(test_df, "../data/interim/test_df.arrow")
+save_dataset(outlier_df, "../data/interim/outlier_df.arrow")
@@ -17,7 +17,7 @@
 # %% [markdown]
 # # Outlier Detector
 # ```
-# dvc run -n outlier_detector --force -d ../data/interim/train_df.pkl -d ../data/interim/test_df.pkl -d ../models/feat_names.json -d ../models/model.pkl -d ../data/interim/outlier_df.pkl -o ../models/outlier_detector.pkl -w notebooks python outlier_detector.pct.py
+# dvc run -n outlier_detector --force -d ../data/interim/train_df.arrow -d ../data/interim/test_df.arrow -d ../models/feat_names.json -d ../models/model.pkl -d ../data/interim/outlier_df.arrow -o ../models/outlier_detector.pkl -w notebooks python outlier_detector.pct.py
 # ```
 
 # %%
@@ -37,12 +37,18 @@ from sklearn.impute import SimpleImputer, KNNImputer, MissingIndicator
 from sklearn.preprocessing import OneHotEncoder
 from joblib import load
 
+# %%
+import sys
+sys.path.append("../")
+from predict_titanic_survival.outlier import OutlierDetector
+from predict_titanic_survival.dataset import load_dataset
+
 # %% [markdown]
 # Load data
 
 # %%
-train_df = pd.read_pickle("../data/interim/train_df.pkl")
-test_df = pd.read_pickle("../data/interim/test_df.pkl")
+train_df = load_dataset("../data/interim/train_df.arrow")
+test_df = load_dataset("../data/interim/test_df.arrow")
 
 # %% [markdown]
 # Load pipeline
@@ -63,28 +69,34 @@ categorical_names={
     6: ["1st class", "2nd class", "3rd class"],
 }
 
+# %% [markdown]
+# The detector is fitted on the output of the already fitted preprocessor of the model. The preprocessor is not refitted, so the service can transform each input once and use the result for both the classifier and the outlier detector.
+
+# %%
+X_train_tf = preprocessor.transform(train_df.drop(columns=["label"]))
+
 # %% [markdown]
 # [Various methods](https://scikit-learn.org/stable/modules/outlier_detection.html#overview-of-outlier-detection-methods) allow the detection of outliers.
 #
 # An [Isolation Forest](https://scikit-learn.org/stable/modules/outlier_detection.html#isolation-forest) is used to identify outliers. The idea behind the Isolation Forest is to split all records in the multiple trees into individual leaves by random splits based on the feature. Outliers then require average shorter paths to be isolated.
 
 # %%
-od = Pipeline(preprocessor.steps + [("sd", StandardScaler()), ("od", IsolationForest(random_state=12345, contamination=0.02))])
-od.fit(train_df.drop(columns=["label"]))
+od = Pipeline([("sd", StandardScaler()), ("od", IsolationForest(random_state=12345, contamination=0.02))])
+od = Pipeline(preprocessor.steps + od.fit(X_train_tf).steps)
 
 # %% [markdown]
 # This is where a [one-class support vector machine](https://scikit-learn.org/stable/modules/generated/sklearn.svm.OneClassSVM.html#sklearn.svm.OneClassSVM) works better. This looks for a hyperplane to narrow down all known data points. The outlier score is then the distance to this hyperplane.
 
 # %%
-od = Pipeline(preprocessor.steps + [("sd", StandardScaler()), 
-#                                    ("pca", PCA(n_components=3)),
-                                    ("od", OneClassSVM(kernel="rbf", nu=0.02, gamma=.02))])
-od.fit(train_df.drop(columns=["label"]))
+od = Pipeline([("sd", StandardScaler()), 
+#              ("pca", PCA(n_components=3)),
+               ("od", OneClassSVM(kernel="rbf", nu=0.02, gamma=.02))])
+od = Pipeline(preprocessor.steps + od.fit(X_train_tf).steps)
 
 # %%
-test_df = pd.read_pickle("../data/interim/test_df.pkl")
+test_df = load_dataset("../data/interim/test_df.arrow")
 test_df["label"]=1 # is inliner
-outlier_df = pd.read_pickle("../data/interim/outlier_df.pkl")
+outlier_df = load_dataset("../data/interim/outlier_df.arrow")
 outlier_df = outlier_df[~outlier_df["fare"].isna()]
 outlier_df["label"]=2 # is outlier
 inlier_df = train_df
@@ -184,11 +196,16 @@ ax.scatter(x=range(pred.shape[0]), y=pred)
 ax.axhline(y=0,c="C1")
 
 # %%
-outlier_df = pd.read_pickle("../data/interim/outlier_df.pkl")
+outlier_df = load_dataset("../data/interim/outlier_df.arrow")
 fig, ax = plt.subplots()
 pred = od.decision_function(outlier_df[~outlier_df["fare"].isna()].drop(columns=["label"]))
 ax.scatter(x=range(pred.shape[0]), y=pred)
 ax.axhline(y=0,c="C1")
 
+# %% [markdown]
+# Only the scaler and the estimator are stored together with the fingerprint of the model's preprocessor.
+
 # %%
-joblib.dump(od, "../models/outlier_detector.pkl")
+outlier_detector = OutlierDetector(preprocessor, Pipeline(od.steps[-2:]))
+assert outlier_detector.shares_preprocessor(Pipeline(load("../models/model.pkl").steps[:-1]))
+joblib.dump(outlier_detector, "../models/outlier_detector.pkl")
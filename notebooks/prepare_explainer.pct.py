@@ -18,7 +18,7 @@
 # # Prepare Explainer
 #
 # ```
-# dvc run -n outlier_model --force -w notebooks -d ../data/interim/train_df.pkl -d ../data/interim/test_df.pkl -d ../models/feat_names.json -d ../models/model.pkl -d ../data/interim/outlier_df.pkl -o ../models/explainer.pkl python prepare_explainer.pct.py
+# dvc run -n outlier_model --force -w notebooks -d ../data/interim/train_df.arrow -d ../data/interim/test_df.arrow -d ../models/feat_names.json -d ../models/model.pkl -d ../data/interim/outlier_df.arrow -o ../models/explainer.pkl python prepare_explainer.pct.py
 # ```
 
 # %%
@@ -30,14 +30,18 @@ from sklearn.pipeline import Pipeline
 
 from lime.lime_tabular import LimeTabularExplainer
 
+import sys
+sys.path.append("../")
+from predict_titanic_survival.dataset import load_dataset
+
 # %% [markdown]
 # ## Model und Daten laden
 
 # %%
 pipeline = joblib.load("../models/model.pkl")
 clf = pipeline.steps[-1][1]
-train_df = pd.read_pickle("../data/interim/train_df.pkl")
-test_df = pd.read_pickle("../data/interim/test_df.pkl")
+train_df = load_dataset("../data/interim/train_df.arrow")
+test_df = load_dataset("../data/interim/test_df.arrow")
 feat_names = json.load(open("../models/feat_names.json", "r"))
 
 # %% [markdown]
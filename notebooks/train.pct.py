@@ -21,7 +21,7 @@
 #
 # Create dvc pipeline:
 # ```
-# dvc run -n train --force -d ../data/interim/train_df.pkl -d train.pct.py -M ../models/score.json -o ../models/model.pkl -o ../models/feat_names.json -w notebooks python train.pct.py
+# dvc run -n train --force -d ../data/interim/train_df.arrow -d train.pct.py -M ../models/score.json -o ../models/model.pkl -o ../models/feat_names.json -w notebooks python train.pct.py
 # ```
 #
 
@@ -35,8 +35,9 @@ import mlflow
 import os
 
 import numpy as np
+from scipy.stats import loguniform, uniform
 from sklearn.utils.class_weight import compute_sample_weight
-from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline, FeatureUnion
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer, KNNImputer, MissingIndicator
@@ -53,14 +54,18 @@ import sys
 sys.path.append("../")
 from predict_titanic_survival.data_prep import CustomFeatures
 from predict_titanic_survival.report import report
+from predict_titanic_survival.impute import IndexedKNNImputer
+from predict_titanic_survival.dataset import load_dataset
+from predict_titanic_survival.export import artifact_stats, check_identical, slim_model
+from predict_titanic_survival.search import CachedPreprocessingGridSearchCV, CachedPreprocessingHalvingSearchCV, ParallelGridSearch
 
 # %% [markdown] hideOutput=false hideCode=true
 # ## Read Data
 
 # %%
-filepath = "../data/interim/train_df.pkl"
+filepath = "../data/interim/train_df.arrow"
 
-data_df = pd.read_pickle(filepath)
+data_df = load_dataset(filepath)
 labels = data_df["label"].copy()
 features = data_df.drop(columns=["label"]).copy()
 
@@ -76,7 +81,7 @@ features_train.shape, features_valid.shape, labels_train.shape, labels_valid.sha
 #
 # The categorical columns are coded ordinally, since this is advantageous e.g. for the treatment in the context of the drift detection later and decision tree-based classifiers have no difficulties with this either.
 #
-# Before the data is run into the classifier, missing values are imputed in the pipeline.
+# Before the data is run into the classifier, missing values are imputed in the pipeline. The `IndexedKNNImputer` imputes the same values as the `KNNImputer`, but looks up the neighbours in an index built at fit time, so the latency at prediction time does not grow with the training data (see `benchmark_imputer.pct.py`).
 
 # %%
 pipeline = Pipeline([
@@ -88,7 +93,7 @@ pipeline = Pipeline([
         ]), ["embarked", "sex", "pclass"])
     ], remainder="drop")),
     ("impute", FeatureUnion([
-        ("imputed", KNNImputer()),
+        ("imputed", IndexedKNNImputer()),
         ("miss_indicator", MissingIndicator()),
     ])),
     ("clf", GradientBoostingClassifier(random_state=1234))
@@ -138,19 +143,47 @@ os.environ["AWS_SECRET_ACCESS_KEY"]='minio-secret-key'
 os.environ["MLFLOW_S3_ENDPOINT_URL"]='http://localhost:9000'
 
 # %% [markdown]
-# Perform GridSearch for hyperparameter optimization.
+# Perform the hyperparameter optimization, either as grid search (`"grid"`) or as successive halving search (`"halving"`).
+#
+# Only the parameters of the classifier are searched, so the preprocessing (in particular the imputer) is fitted only once per fold instead of once per fold and parameter combination. The transformed folds are memory-mapped and shared by the parallel workers. The grid search gives the same results as `GridSearchCV(pipeline, ...)`; in MLFlow, the search of the classifier is logged with the parameter names without the `clf__` prefix.
+#
+# The successive halving search evaluates 100 random candidates with 1 tree each and continues with the best tenth of them with ten times as many trees, up to 100 trees (as in the grid). With `n_iter_no_change`, the classifier stops adding trees once the score on 10 % of the training data does not improve anymore.
+#
+# The halving search does **not** fit into the time of the 2x2 grid: on one core it takes about 1.9 s against 1.0 s. Each fit of the `GradientBoostingClassifier` has a fixed cost of about 3 ms (as much as about five trees), and the first round alone takes 100 fits per fold, i.e. longer than the whole grid with its 16 fits of 100 trees. Per candidate, halving is much cheaper: a grid over 100 candidates would take about 25 s. It pays off once the grid would have more than about 8 points; for a handful of points, use the grid.
+
+# %%
+search_mode = "halving"
 
 # %%
-param_grid = {
-    "clf__max_depth": [2, 3],
-    "clf__min_samples_leaf": [5, 20]
-}
-grid_search = GridSearchCV(pipeline, param_grid=param_grid, cv=4, n_jobs=4, scoring="accuracy")
 sample_weight = compute_sample_weight("balanced", labels_train)
+if search_mode == "grid":
+    param_grid = {
+        "clf__max_depth": [2, 3],
+        "clf__min_samples_leaf": [5, 20]
+    }
+    grid_search = CachedPreprocessingGridSearchCV(pipeline, param_grid=param_grid, cv=4, n_jobs=4, scoring="accuracy")
+else:
+    param_distributions = {
+        "clf__max_depth": [2, 3, 4],
+        "clf__min_samples_leaf": [5, 10, 20, 40],
+        "clf__learning_rate": loguniform(0.01, 0.3),
+        "clf__subsample": uniform(0.5, 0.5),
+        "clf__n_iter_no_change": [10],
+        "clf__validation_fraction": [0.1],
+    }
+    grid_search = CachedPreprocessingHalvingSearchCV(
+        pipeline, param_distributions=param_distributions, n_candidates=100, factor=10,
+        resource="clf__n_estimators", min_resources=1, max_resources=100,
+        cv=4, n_jobs=4, scoring="accuracy", random_state=12345)
 
 with mlflow.start_run() as run:
     # Grid-Search unter Berücksichtigung der Sample-Weights durchführen
     grid_search.fit(features_train, labels_train, **{"clf__sample_weight": sample_weight})
+    mlflow.log_params(grid_search.best_params_)
+    mlflow.log_metric("best_cv_score", grid_search.best_score_)
+
+# %%
+grid_search.best_params_
 
 # %% [markdown]
 # The results can now be viewed in [MLFlow](http://localhost:5000)
@@ -188,14 +221,19 @@ metric_frame.by_group
 # %% [markdown]
 # The idea behind [fairlearn](https://fairlearn.org/) is based on [Agarwal et al.](https://arxiv.org/pdf/1803.02453.pdf). In short, a Lagrange multiplier is used in a grid search to adjust the weights of individual data points in such a way that the remaining deviations from fairness are weighted more. The classifier that provides the best trade-off between fairness and performance is used. [GridSearch](https://fairlearn.org/v0.5.0/api_reference/fairlearn.reductions.html#fairlearn.reductions.GridSearch) provides non-randomized results and also allows the output of scores.
 
+#
+# `ParallelGridSearch` gives the same results as `GridSearch`, but fits the classifiers of the grid points in parallel processes, which share the memory-mapped feature matrix. The fit time of each grid point is logged to MLFlow.
+
 # %%
-from fairlearn.reductions import ErrorRateParity, GridSearch
+from fairlearn.reductions import ErrorRateParity
 np.random.seed(seed=12345)
-mitigator = GridSearch(grid_search.best_estimator_.steps[-1][1], ErrorRateParity())
+mitigator = ParallelGridSearch(grid_search.best_estimator_.steps[-1][1], ErrorRateParity(), n_jobs=-1)
 features_train_tf = Pipeline(grid_search.best_estimator_.steps[:-1]).transform(features_train)
 mlflow.autolog()
 with mlflow.start_run() as fairness_run:
     mitigator.fit(features_train_tf, labels_train, sensitive_features=features_train["sex"])
+    for step, fit_time in enumerate(mitigator.oracle_execution_times_):
+        mlflow.log_metric("grid_point_fit_time", fit_time, step=step)
     
     # Konstruktion einer neuen Pipeline mit mitigiertem Classifier
     mitigated_clf = Pipeline(grid_search.best_estimator_.steps[:-1] + [("model", mitigator)])
@@ -274,12 +312,20 @@ pipeline.set_params(**grid_search.best_params_)
 pipeline.fit(features, labels, **{"clf__sample_weight": sample_weight})
 
 # %%
-mitigator = GridSearch(grid_search.best_estimator_.steps[-1][1], ErrorRateParity())
+mitigator = ParallelGridSearch(grid_search.best_estimator_.steps[-1][1], ErrorRateParity(), n_jobs=-1)
 preprocessor = Pipeline(pipeline.steps[:-1])
 features_tf = preprocessor.transform(features)
 mitigator.fit(features_tf, labels, sensitive_features=features["sex"])
 pipeline = Pipeline(preprocessor.steps + [("clf", mitigator)])
 
+# %% [markdown]
+# For serving, only the classifier selected by the mitigation is kept, together with a record of the Lagrange multipliers, objectives and constraint violations of the grid for auditing. It is compiled to a `CompiledTreeEnsemble`, which is used for batches up to the size from which on the classifier itself is faster (`max_rows`, measured on the training rows). The slim model has to predict exactly the same as the full model.
+
+# %%
+serving_pipeline = slim_model(pipeline, features)
+check_identical(pipeline, serving_pipeline, features)
+pd.DataFrame({"full": artifact_stats(pipeline), "slim": artifact_stats(serving_pipeline)})
+
 # %% [markdown]
 # ## Save Output
 #
@@ -288,7 +334,7 @@ pipeline = Pipeline(preprocessor.steps + [("clf", mitigator)])
 # %%
 os.makedirs("../models", exist_ok=True)
 with open("../models/model.pkl", "wb") as f:
-    cloudpickle.dump(pipeline, f)
+    cloudpickle.dump(serving_pipeline, f)
 
 # %% [markdown]
 # Save metrics
@@ -0,0 +1,88 @@
+"""
+Module for loading model artifacts shared between worker processes.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import cloudpickle
+import joblib
+import numpy as np
+
+# Arrays smaller than a memory page are not worth sharing
+MIN_MMAP_BYTES = 4096
+
+class _ArrayExtractingPickler(cloudpickle.CloudPickler):
+    """Pickler that stores large numpy arrays as separate .npy files."""
+    def __init__(self, file, directory):
+        super().__init__(file)
+        self.directory = directory
+        self.n_arrays = 0
+
+    def persistent_id(self, obj): # pylint: disable=arguments-renamed
+        if type(obj) is np.ndarray and not obj.dtype.hasobject and obj.nbytes >= MIN_MMAP_BYTES:
+            name = f"array_{self.n_arrays}.npy"
+            self.n_arrays += 1
+            np.save(os.path.join(self.directory, name), obj)
+            return name
+        return None
+
+class _MmapUnpickler(pickle.Unpickler):
+    """Unpickler that memory-maps the arrays stored by `_ArrayExtractingPickler`."""
+    def __init__(self, file, directory):
+        super().__init__(file)
+        self.directory = directory
+
+    def persistent_load(self, pid):
+        # Plain ndarray on the mapped pages, so that e.g. `joblib.hash` gives
+        # the same result as for the original array
+        return np.load(os.path.join(self.directory, pid), mmap_mode="r").view(np.ndarray)
+
+def load_artifact(path, mmap_dir=None):
+    """
+    Load the pickled artifact at `path`.
+
+    With `mmap_dir`, the artifact is converted once into a directory in
+    `mmap_dir` (named after the size and modification time of `path`), in
+    which its large numpy arrays are stored as .npy files. These arrays are
+    then memory-mapped read-only, so all processes loading the artifact this
+    way share their pages instead of holding their own copies.
+    """
+    if mmap_dir is None:
+        return joblib.load(path)
+    stat = os.stat(path)
+    directory = os.path.join(mmap_dir, f"{os.path.basename(path)}.{stat.st_size}.{stat.st_mtime_ns}")
+    if not os.path.isdir(directory):
+        os.makedirs(mmap_dir, exist_ok=True)
+        # Convert into a temporary directory first, other processes may
+        # convert the same artifact concurrently
+        tmp_directory = tempfile.mkdtemp(dir=mmap_dir)
+        with open(os.path.join(tmp_directory, "artifact.pkl"), "wb") as f:
+            _ArrayExtractingPickler(f, tmp_directory).dump(joblib.load(path))
+        try:
+            os.rename(tmp_directory, directory)
+        except OSError:
+            shutil.rmtree(tmp_directory)
+    with open(os.path.join(directory, "artifact.pkl"), "rb") as f:
+        return _MmapUnpickler(f, directory).load()
+
+def memory_usage():
+    """
+    Memory of the current process in bytes from /proc/self/smaps_rollup
+    (Linux only, empty otherwise): `rss`, `pss` (shared pages divided by the
+    number of processes sharing them), `shared` and `private`.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            fields = dict(line.split(":", 1) for line in f.readlines()[1:])
+    except OSError:
+        return {}
+    kib = {key: int(value.split()[0]) for key, value in fields.items()}
+    return {
+        "rss": kib["Rss"] * 1024,
+        "pss": kib["Pss"] * 1024,
+        "shared": (kib["Shared_Clean"] + kib["Shared_Dirty"]) * 1024,
+        "private": (kib["Private_Clean"] + kib["Private_Dirty"]) * 1024,
+    }
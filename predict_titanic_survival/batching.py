@@ -0,0 +1,93 @@
+"""
+Module for micro-batching of concurrent single-row requests.
+"""
+
+import asyncio
+import contextlib
+
+class MicroBatcher:
+    """
+    Collects the records of concurrent requests in a queue and scores them
+    with one vectorized call.
+
+    A batch is flushed as soon as it holds `max_batch_size` records or the
+    oldest record has waited `max_wait` seconds. `score_batch` receives a list
+    of records and has to return one result per record. It runs in the default
+    executor of the event loop, one batch at a time.
+    """
+    def __init__(self, score_batch, max_batch_size=64, max_wait=0.002):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._worker = None
+        self._get = None
+
+    def start(self):
+        """Start the worker task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._worker
+        if self._get is not None:
+            self._get.cancel()
+
+    async def submit(self, record):
+        """Enqueue `record` and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, future))
+        return await future
+
+    async def _next(self, timeout=None):
+        """
+        Next item of the queue, or None if there is none within `timeout`
+        seconds. A `get` still pending after the timeout is kept for the next
+        call: cancelling it (as `asyncio.wait_for` does before Python 3.12)
+        could drop an item it dequeued at the same moment.
+        """
+        if self._get is None:
+            self._get = asyncio.ensure_future(self._queue.get())
+        done, _ = await asyncio.wait({self._get}, timeout=timeout)
+        if not done:
+            return None
+        item, self._get = self._get.result(), None
+        return item
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._next()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            item = await self._next(timeout)
+            if item is None:
+                break
+            batch.append(item)
+        while len(batch) < self.max_batch_size and self._get is None and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests that were cancelled in the meantime need not be scored
+            batch = [(record, future) for record, future in batch if not future.done()]
+            if not batch:
+                continue
+            records, futures = zip(*batch)
+            try:
+                results = await loop.run_in_executor(None, self.score_batch, list(records))
+            except Exception as exc: # pylint: disable=broad-except
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
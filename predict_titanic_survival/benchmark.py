@@ -0,0 +1,280 @@
+"""
+Module for benchmarking the stages of the inference path.
+
+Each stage of scoring a request is timed in isolation for batch sizes from
+1 to 10000 rows, either with the artifacts in `models/` or with a
+synthetic stand-in pipeline of the same shape (`--synthetic`, no DVC data
+needed). The results are written as JSON baseline and can be compared with
+the baseline of another commit:
+
+    python -m predict_titanic_survival.benchmark --output benchmarks/main.json
+    python -m predict_titanic_survival.benchmark --compare benchmarks/main.json
+
+With `--compare`, the script exits with status 1 if a stage got slower by
+more than `--threshold` (default 20 %).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.impute import MissingIndicator, SimpleImputer
+from sklearn.pipeline import FeatureUnion, Pipeline
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+from sklearn.svm import OneClassSVM
+
+from predict_titanic_survival.artifacts import load_artifact
+from predict_titanic_survival.compiled import CompiledTreeEnsemble, compile_model
+from predict_titanic_survival.dataset import load_dataset
+from predict_titanic_survival.drift import DriftDetector
+from predict_titanic_survival.impute import IndexedKNNImputer
+from predict_titanic_survival.outlier import OutlierDetector
+from predict_titanic_survival.schema import Input
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+# LIME explains one instance at a time with thousands of model calls
+MAX_EXPLAIN_BATCH_SIZE = 1
+CATEGORICAL_FEATURES = [4, 5, 6]
+CATEGORICAL_NAMES = {
+    4: ['C', 'Missing', 'Q', 'S'],
+    5: ['female', 'male'],
+    6: ["1st class", "2nd class", "3rd class"],
+}
+
+def synthetic_passengers(n, random_state=0):
+    """Passengers with the columns of `Input`; `age` is missing for about 20 %."""
+    rng = np.random.RandomState(random_state)
+    df = pd.DataFrame({
+        "pclass": rng.randint(1, 4, n),
+        "name": [f"Name {i}" for i in range(n)],
+        "sex": rng.choice(["female", "male"], n),
+        "age": np.round(rng.gamma(4, 7.5, n)),
+        "sibsp": rng.poisson(.5, n),
+        "parch": rng.poisson(.4, n),
+        "ticket": [str(100000 + i) for i in range(n)],
+        "fare": np.round(rng.lognormal(2.8, 1., n), 4),
+        "cabin": rng.choice(["B5", ""], n, p=[.25, .75]),
+        "embarked": rng.choice(["C", "Q", "S"], n, p=[.2, .1, .7]),
+        "home.dest": "Somewhere",
+    })
+    df.loc[rng.rand(n) < .2, "age"] = np.nan
+    return df
+
+def synthetic_artifacts(n_train=1000, random_state=0):
+    """
+    Model, outlier detector, drift detector and LIME explainer with the
+    same structure as the ones of the DVC pipeline, fitted on synthetic
+    passengers.
+    """
+    from lime.lime_tabular import LimeTabularExplainer # pylint: disable=import-outside-toplevel
+    X_train = synthetic_passengers(n_train, random_state)
+    y_train = ((X_train["sex"] == "female") | (X_train["pclass"] == 1)).astype(int).values
+    y_train[np.random.RandomState(random_state).rand(n_train) < .2] ^= 1
+    # Same pipeline as in notebooks/train.pct.py
+    pipeline = Pipeline([
+        ("select_feat", ColumnTransformer([
+            ("select_num_cols", "passthrough", ["sibsp", "parch", "fare", "age"]),
+            ("encode_str_cols", Pipeline([
+                ("replace_nan", SimpleImputer(strategy="constant", fill_value="Missing")),
+                ("encode", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=4))
+            ]), ["embarked", "sex", "pclass"])
+        ], remainder="drop")),
+        ("impute", FeatureUnion([
+            ("imputed", IndexedKNNImputer()),
+            ("miss_indicator", MissingIndicator()),
+        ])),
+        ("clf", GradientBoostingClassifier(random_state=1234))
+    ]).fit(X_train, y_train)
+    preprocessor = Pipeline(pipeline.steps[:-1])
+    X_train_tf = preprocessor.transform(X_train)
+    feat_names = list(preprocessor.get_feature_names_out())
+    outlier_detector = OutlierDetector(preprocessor, Pipeline([
+        ("sd", StandardScaler()), ("od", OneClassSVM(kernel="rbf", nu=0.02, gamma=.02))]).fit(X_train_tf))
+    return {
+        "model": pipeline,
+        "outlier_detector": outlier_detector,
+        "drift_detector": DriftDetector(X_train, preprocessor, feat_names, CATEGORICAL_FEATURES),
+        "explainer": LimeTabularExplainer(
+            X_train_tf, feature_names=feat_names, class_names=["died", "survived"],
+            discretize_continuous=True, categorical_features=CATEGORICAL_FEATURES,
+            categorical_names=CATEGORICAL_NAMES, random_state=random_state),
+    }
+
+def load_artifacts(models_dir="models"):
+    """The artifacts of the DVC pipeline in `models_dir`."""
+    outlier_detector = load_artifact(os.path.join(models_dir, "outlier_detector.pkl"))
+    if isinstance(outlier_detector, Pipeline):
+        outlier_detector = OutlierDetector.from_pipeline(outlier_detector)
+    return {
+        "model": load_artifact(os.path.join(models_dir, "model.pkl")),
+        "outlier_detector": outlier_detector,
+        "drift_detector": load_artifact(os.path.join(models_dir, "drift_detector.pkl")),
+        "explainer": load_artifact(os.path.join(models_dir, "explainer.pkl")),
+    }
+
+def stages(artifacts):
+    """
+    The stages of the inference path as (name, prepare, run): `prepare`
+    turns a batch of passengers into the input of the stage (untimed),
+    `run` is the timed call.
+    """
+    model = artifacts["model"]
+    column_transformer = model.steps[0][1]
+    imputer = Pipeline(model.steps[1:-1])
+    preprocessor = Pipeline(model.steps[:-1])
+    classifier = model.steps[-1][1]
+    if hasattr(classifier, "predictors_") and hasattr(classifier, "best_idx_"):
+        # fairlearn GridSearch and SelectedPredictor predict with their best predictor
+        classifier = classifier.predictors_[classifier.best_idx_]
+    if isinstance(classifier, CompiledTreeEnsemble):
+        # The baseline is the classifier of sklearn
+        classifier = classifier.estimator
+    compiled_classifier = compile_model(classifier)
+    detector = artifacts["outlier_detector"].detector
+    drift_detector = artifacts["drift_detector"]
+    explainer = artifacts["explainer"]
+
+    def records(df):
+        # None instead of NaN, as in the JSON of the requests
+        return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+    def validate(batch):
+        return [Input.parse_obj(record) for record in batch]
+
+    def inputs(df):
+        # Missing values are not valid inputs of the API
+        return records(df.fillna({"age": 0.0, "fare": 0.0}).fillna(""))
+
+    return [
+        ("input_validation", inputs, validate),
+        ("dataframe", records, pd.DataFrame),
+        ("column_transformer", lambda df: df, column_transformer.transform),
+        ("imputer", column_transformer.transform, imputer.transform),
+        ("predict_proba", preprocessor.transform, classifier.predict_proba),
+        ("compiled_predict_proba", preprocessor.transform, compiled_classifier.predict_proba),
+        ("outlier_decision_function", preprocessor.transform, detector.decision_function),
+        ("drift_test", preprocessor.transform, drift_detector.test_transformed),
+        ("explain_instance", lambda df: preprocessor.transform(df)[0],
+         lambda x: explainer.explain_instance(x, classifier.predict_proba)),
+    ]
+
+def time_stage(run, stage_input, min_time=0.2, min_repeats=3, max_repeats=1000):
+    """Call `run(stage_input)` once to warm up, then at least `min_repeats`
+    times and for at least `min_time` seconds; return the durations."""
+    run(stage_input)
+    durations = []
+    total = 0.0
+    while len(durations) < max_repeats and (len(durations) < min_repeats or total < min_time):
+        start = time.perf_counter()
+        run(stage_input)
+        durations.append(time.perf_counter() - start)
+        total += durations[-1]
+    return np.array(durations)
+
+def run_benchmark(artifacts, passengers, batch_sizes=BATCH_SIZES, stage_names=None, min_time=0.2):
+    """Time each stage for each batch size and return one result per stage and batch size."""
+    results = []
+    for name, prepare, run in stages(artifacts):
+        if stage_names is not None and name not in stage_names:
+            continue
+        for batch_size in batch_sizes:
+            if name == "explain_instance" and batch_size > MAX_EXPLAIN_BATCH_SIZE:
+                continue
+            batch = passengers.iloc[np.arange(batch_size) % len(passengers)].reset_index(drop=True)
+            durations = time_stage(run, prepare(batch), min_time=min_time)
+            results.append({
+                "stage": name,
+                "batch_size": batch_size,
+                "repeats": len(durations),
+                "median_s": float(np.median(durations)),
+                "min_s": float(durations.min()),
+                "p90_s": float(np.percentile(durations, 90)),
+                "rows_per_s": batch_size / float(np.median(durations)),
+            })
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare(baseline, results, threshold=0.2):
+    """
+    Compare the median durations of `results` with those of `baseline`
+    per stage and batch size. Returns one row per common measurement with
+    the `ratio` of the durations and whether it is a `regression`.
+    """
+    baseline_medians = {(row["stage"], row["batch_size"]): row["median_s"] for row in baseline}
+    rows = []
+    for row in results:
+        key = (row["stage"], row["batch_size"])
+        if key in baseline_medians:
+            ratio = row["median_s"] / baseline_medians[key]
+            rows.append({
+                "stage": row["stage"],
+                "batch_size": row["batch_size"],
+                "baseline_s": baseline_medians[key],
+                "median_s": row["median_s"],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("--models", default="models", help="Directory with the artifacts")
+    parser.add_argument("--synthetic", action="store_true", help="Use a synthetic stand-in pipeline")
+    parser.add_argument("--data", help="Dataset with passengers, e.g. data/interim/test_df.arrow (default: synthetic)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per measurement")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tolerated slowdown for --compare")
+    args = parser.parse_args()
+
+    artifacts = synthetic_artifacts() if args.synthetic else load_artifacts(args.models)
+    if args.data is None:
+        passengers = synthetic_passengers(max(args.batch_sizes), random_state=1)
+    else:
+        passengers = load_dataset(args.data).drop(columns=["label"], errors="ignore")
+    results = run_benchmark(artifacts, passengers, args.batch_sizes, args.stages, args.min_time)
+    print(pd.DataFrame(results).set_index(["stage", "batch_size"]).to_string())
+
+    if args.output is not None:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "environment": environment(),
+                "artifacts": "synthetic" if args.synthetic else args.models,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            comparison = compare(json.load(f)["results"], results, args.threshold)
+        print(pd.DataFrame(comparison).set_index(["stage", "batch_size"]).to_string())
+        if any(row["regression"] for row in comparison):
+            sys.exit(1)
@@ -0,0 +1,81 @@
+"""
+Module for caching responses of the model API.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+def canonical_key(record, *extra):
+    """Hash of a validated input record (and `extra` values) independent of the key order."""
+    payload = json.dumps([record, *extra], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+def artifact_fingerprint(paths):
+    """Fingerprint of artifact files from their path, size and modification time."""
+    stats = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths]
+    return canonical_key(stats)
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with at most `maxsize` entries, each of which
+    expires `ttl` seconds after it was stored. The entries belong to a
+    `version` (e.g. the fingerprint of the loaded artifacts); setting another
+    version drops all entries. `maxsize=0` disables the cache.
+
+    `on_hit`, `on_miss` and `on_evict` are called without arguments (e.g. to
+    count them in Prometheus metrics); expired entries count as evicted.
+    """
+    def __init__(self, maxsize, ttl, version=None, on_hit=None, on_miss=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.on_hit = on_hit
+        self.on_miss = on_miss
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+
+    def get(self, key):
+        """Cached value for `key` or None."""
+        if not self.maxsize:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self._notify(self.on_evict)
+                entry = None
+            if entry is None:
+                self._notify(self.on_miss)
+                return None
+            self._entries.move_to_end(key)
+        self._notify(self.on_hit)
+        return entry[1]
+
+    def set(self, key, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._notify(self.on_evict)
+
+    @staticmethod
+    def _notify(callback):
+        if callback is not None:
+            callback()
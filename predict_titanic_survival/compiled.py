@@ -0,0 +1,164 @@
+"""
+Module for evaluating gradient boosted trees with numpy.
+"""
+
+import time
+
+import numpy as np
+from scipy.special import expit, logsumexp
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import GradientBoostingClassifier
+
+class CompiledTreeEnsemble:
+    """
+    Predictions of a fitted `GradientBoostingClassifier`, with all of its
+    trees flattened into contiguous arrays.
+
+    All trees are evaluated for a whole batch at once: starting at the roots,
+    each step moves every (tree, row) pair one level down, so a batch takes
+    as many numpy operations as the trees are deep, instead of the input
+    validation and the loop over the trees of `predict_proba`. As in
+    sklearn, the inputs are compared as float32, the leaf values are added
+    up one after the other and the probabilities are computed as by the
+    loss of the classifier, so they are the same.
+
+    The numpy operations touch every (tree, row) pair several times, so the
+    gain shrinks with the batch size, and batches of more than `max_rows`
+    rows (e.g. the samples of LIME) are predicted by the classifier itself.
+    `calibrate` sets `max_rows` to the crossover measured on given rows;
+    without it, e.g. for models compiled when loading, 32 rows are used. The
+    classifier is kept as `estimator`, e.g. for `TreeShapExplainer`.
+    """
+    # Batch sizes at which `calibrate` compares the compiled trees and the classifier
+    crossover_batch_sizes = (1, 2, 4, 8, 16, 24, 32, 48, 64, 96, 128, 192, 256)
+
+    def __init__(self, estimator, max_rows=32):
+        if not isinstance(estimator, GradientBoostingClassifier):
+            raise TypeError(f"{type(estimator).__name__} is not a GradientBoostingClassifier")
+        if not (estimator.init_ == "zero" or isinstance(estimator.init_, DummyClassifier)):
+            raise ValueError("Only constant init estimators are supported")
+        if estimator.loss not in ("log_loss", "deviance", "exponential"):
+            raise ValueError(f"Loss {estimator.loss!r} is not supported")
+        self.estimator = estimator
+        self.max_rows = max_rows
+        self.classes_ = estimator.classes_
+        self.n_features_in_ = estimator.n_features_in_
+        self.loss = estimator.loss
+        # Constant raw prediction of the init estimator
+        self.init_raw = estimator._raw_predict_init( # pylint: disable=protected-access
+            np.zeros((1, self.n_features_in_), dtype=np.float32))[0]
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        depth = 0
+        # Stage by stage, as `predict_stages` adds the trees up
+        for tree in (regressor.tree_ for regressor in estimator.estimators_.ravel()):
+            is_leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count)
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # Right and left child of each node; leaves point to themselves,
+            # so rows that reached them stay there
+            children.append(np.stack([np.where(is_leaf, nodes, tree.children_right),
+                                      np.where(is_leaf, nodes, tree.children_left)], axis=1) + offset)
+            values.append(estimator.learning_rate * tree.value[:, 0, 0])
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.children = np.concatenate(children).ravel().astype(np.intp)
+        self.value = np.concatenate(values)
+        self.roots = np.array(roots, dtype=np.intp)
+        self.depth = depth
+
+    def raw_predict(self, X):
+        """Raw predictions of shape (n_samples, n_outputs), as `_raw_predict` of the classifier."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, but {self.n_features_in_} features are expected")
+        n_samples = X.shape[0]
+        X_flat = X.ravel()
+        row_offsets = np.arange(n_samples) * X.shape[1]
+        # One row per tree (stage by stage, outputs within a stage), one column per sample
+        nodes = np.repeat(self.roots[:, np.newaxis], n_samples, axis=1)
+        for _ in range(self.depth):
+            go_left = X_flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        n_outputs = len(self.init_raw)
+        contributions = np.concatenate([
+            np.broadcast_to(self.init_raw[np.newaxis, :, np.newaxis], (1, n_outputs, n_samples)),
+            self.value[nodes].reshape(-1, n_outputs, n_samples),
+        ])
+        # Accumulated stage by stage, as `predict_stages` does; unlike `sum`,
+        # which adds pairwise where the stages are contiguous (single rows)
+        return np.add.accumulate(contributions, axis=0)[-1].T
+
+    def raw_prediction_to_proba(self, raw_predictions):
+        """Probabilities of the raw predictions, as the loss of the classifier computes them."""
+        if len(self.classes_) > 2:
+            # Multinomial deviance
+            return np.nan_to_num(np.exp(raw_predictions - logsumexp(raw_predictions, axis=1)[:, np.newaxis]))
+        if self.loss == "exponential":
+            raw_predictions = 2.0 * raw_predictions
+        # Binomial deviance or exponential loss
+        proba = np.ones((raw_predictions.shape[0], 2), dtype=np.float64)
+        proba[:, 1] = expit(raw_predictions.ravel())
+        proba[:, 0] -= proba[:, 1]
+        return proba
+
+    def calibrate(self, X, repeats=5):
+        """
+        Set `max_rows` to the largest of `crossover_batch_sizes` up to which
+        the compiled trees predict batches of the rows `X` (repeated as
+        needed) faster than the classifier, best of `repeats` calls each; 0 if
+        they never are. The crossover depends on the data (the paths of the
+        rows through the trees of the classifier), so `X` should be real
+        rows. Returns self.
+        """
+        X = np.asarray(X, dtype=np.float64)
+
+        def best_time(predict_proba, batch):
+            durations = []
+            for _ in range(repeats + 1):
+                start = time.perf_counter()
+                predict_proba(batch)
+                durations.append(time.perf_counter() - start)
+            # The first call warms up
+            return min(durations[1:])
+
+        max_rows = 0
+        for batch_size in self.crossover_batch_sizes:
+            batch = X[np.arange(batch_size) % len(X)]
+            compiled = best_time(lambda batch: self.raw_prediction_to_proba(self.raw_predict(batch)), batch)
+            if compiled >= best_time(self.estimator.predict_proba, batch):
+                break
+            max_rows = batch_size
+        self.max_rows = max_rows
+        return self
+
+    def predict_proba(self, X):
+        if len(X) > self.max_rows:
+            return self.estimator.predict_proba(X)
+        return self.raw_prediction_to_proba(self.raw_predict(X))
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+def compile_model(model):
+    """
+    `model` as `CompiledTreeEnsemble` if it is a `GradientBoostingClassifier`
+    or predicts with one as `predictors_[best_idx_]` (fairlearn `GridSearch`,
+    `SelectedPredictor`). Other models are returned unchanged.
+    """
+    if isinstance(model, CompiledTreeEnsemble):
+        return model
+    predictor = model
+    if hasattr(model, "predictors_") and hasattr(model, "best_idx_"):
+        predictor = model.predictors_[model.best_idx_]
+        if isinstance(predictor, CompiledTreeEnsemble):
+            return predictor
+    try:
+        return CompiledTreeEnsemble(predictor)
+    except (TypeError, ValueError):
+        return model
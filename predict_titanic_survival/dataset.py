@@ -0,0 +1,63 @@
+"""
+Module for reading and writing the interim datasets.
+
+The datasets are stored as uncompressed Arrow IPC files (`.arrow`), which
+are memory-mapped when read, so only the columns actually used are read
+from disk. Parquet (`.parquet`) and pickled DataFrames are read as well.
+"""
+
+import os
+
+import pandas as pd
+
+# Compact dtypes of the Titanic columns; all other columns are kept as they are
+COMPACT_DTYPES = {
+    "pclass": "int8",
+    "sibsp": "int8",
+    "parch": "int8",
+    "label": "int8",
+    "sex": "category",
+    "embarked": "category",
+}
+
+def to_compact(df):
+    """`df` with the dtypes of `COMPACT_DTYPES` for the columns it contains."""
+    return df.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in df.columns})
+
+def save_dataset(df, path):
+    """Write `df` with compact dtypes (see `to_compact`) to `path` (.arrow or .parquet)."""
+    import pyarrow as pa # pylint: disable=import-outside-toplevel
+    df = to_compact(df)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".arrow", ".feather"):
+        table = pa.Table.from_pandas(df)
+        # Uncompressed, so the file can be memory-mapped
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif extension == ".parquet":
+        df.to_parquet(path)
+    else:
+        raise ValueError(f"Unsupported format for {path}, use .arrow or .parquet")
+
+def load_dataset(path, columns=None, memory_map=True):
+    """
+    Read the DataFrame at `path` (.arrow, .parquet or pickle), only with
+    `columns` (default: all). Arrow files are memory-mapped unless
+    `memory_map` is False, so reading a subset of the columns only touches
+    their pages.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".arrow", ".feather"):
+        import pyarrow as pa # pylint: disable=import-outside-toplevel
+        source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            # Keep the columns of the index, so that it is restored
+            index_columns = [column for column in table.schema.pandas_metadata["index_columns"]
+                             if isinstance(column, str)]
+            table = table.select(list(columns) + index_columns)
+        return table.to_pandas(split_blocks=True)
+    if extension == ".parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=memory_map)
+    df = pd.read_pickle(path)
+    return df if columns is None else df[list(columns)]
@@ -0,0 +1,195 @@
+"""
+Module for drift detection on the inputs of the model.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from math import gcd
+from threading import Lock
+
+import numpy as np
+from scipy.stats import chi2, kstwo
+# The exact distribution of the two-sided statistic as computed by ks_2samp
+from scipy.stats._stats_py import _attempt_exact_2kssamp
+
+logger = logging.getLogger(__name__)
+
+# Largest sample for which ks_2samp computes the exact p-value by default
+KS_MAX_EXACT_N = 10000
+
+@lru_cache(maxsize=4096)
+def _ks_p_value(d, n_ref, n_obs):
+    """
+    p-value of `ks_2samp` (two-sided, default method) for the statistic `d`
+    of samples of sizes `n_ref` and `n_obs`. It only depends on these, so it
+    is computed without the samples: exactly for samples of up to
+    `KS_MAX_EXACT_N` values, else with the asymptotic distribution. The most
+    recent ones are cached.
+    """
+    if max(n_ref, n_obs) <= KS_MAX_EXACT_N:
+        success, _, prob = _attempt_exact_2kssamp(n_ref, n_obs, gcd(n_ref, n_obs), d, "two-sided")
+        if success:
+            return np.clip(prob, 0, 1)
+    return np.clip(kstwo.sf(d, np.round(n_ref * n_obs / (n_ref + n_obs))), 0, 1)
+
+class DriftDetector:
+    """
+    Compares the distribution of each preprocessed feature with the training
+    data: Kolmogorov-Smirnov test for numeric and chi-square test for
+    categorical features. Drift is detected if any p-value falls below
+    `p_value` divided by the number of features (Bonferroni correction).
+
+    The sorted training columns (i.e. their ECDFs) and the category counts
+    are computed once at construction, so the cost of a test only depends on
+    the size of the tested data. The p-values are the same as those of
+    `scipy.stats.ks_2samp` and `scipy.stats.chi2_contingency`. Categories
+    missing in both training and tested data are left out of the contingency
+    table.
+    """
+    def __init__(self, X_train, preprocessor, feat_names, categorical_features):
+        self.preprocessor = preprocessor
+        self.feat_names = feat_names
+        self.categorical_features = categorical_features
+        self.p_value = 0.5
+        self._fit_reference(self._preprocess(X_train))
+
+    def _fit_reference(self, X_train):
+        self.n_features = X_train.shape[1]
+        self.numeric_features = [
+            feat for feat in range(self.n_features) if feat not in self.categorical_features]
+        self.reference = np.sort(X_train[:, self.numeric_features], axis=0)
+        codes = X_train[:, list(self.categorical_features)].astype(int)
+        self.category_counts = self._count_categories(codes, codes.max(initial=0) + 1)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Detector pickled with its own cache of KS p-values
+        self.__dict__.pop("_ks_p_values", None)
+        if "X_train" in state:
+            # Detector pickled before the references were precomputed
+            self._fit_reference(self.__dict__.pop("X_train"))
+
+    @staticmethod
+    def _count_categories(codes, n_categories):
+        """Counts of the codes per column as array (n_columns, n_categories)."""
+        offsets = np.arange(codes.shape[1]) * n_categories
+        counts = np.bincount((codes + offsets).ravel(), minlength=codes.shape[1] * n_categories)
+        return counts.reshape(codes.shape[1], n_categories)
+
+    def _preprocess(self, X):
+        return self.preprocessor.transform(X)
+
+    def test(self, X):
+        return self.test_transformed(self._preprocess(X))
+
+    def test_transformed(self, X):
+        """p-values per feature for data already transformed by `preprocessor`."""
+        p_values = np.empty(self.n_features)
+        p_values[self.numeric_features] = self._test_numeric(X[:, self.numeric_features])
+        p_values[self.categorical_features] = self._test_categorical(
+            X[:, list(self.categorical_features)].astype(int))
+        return p_values.tolist()
+
+    def _test_numeric(self, X):
+        """Two-sided two-sample KS tests of all columns against the reference."""
+        n_ref, n_obs = len(self.reference), len(X)
+        X = np.sort(X, axis=0)
+        p_values = []
+        for reference, obs in zip(self.reference.T, X.T):
+            # The ECDF difference only has to be evaluated at the observed
+            # values and just below them: between two observed values it is
+            # monotonic.
+            count_ref = np.r_[np.searchsorted(reference, obs, side="right"),
+                              np.searchsorted(reference, obs, side="left")]
+            count_obs = np.r_[np.searchsorted(obs, obs, side="right"),
+                              np.searchsorted(obs, obs, side="left")]
+            cddiffs = count_ref / n_ref - count_obs / n_obs
+            arg_max, arg_min = np.argmax(cddiffs), np.argmin(cddiffs)
+            min_s, max_s = np.clip(-cddiffs[arg_min], 0, 1), cddiffs[arg_max]
+            p_values.append(_ks_p_value(float(min_s if min_s > max_s else max_s), n_ref, n_obs))
+        return p_values
+
+    def _test_categorical(self, codes):
+        """Chi-square tests of independence of all columns at once."""
+        n_categories = max(self.category_counts.shape[1], codes.max(initial=0) + 1)
+        observed = np.zeros((codes.shape[1], 2, n_categories))
+        observed[:, 0, :self.category_counts.shape[1]] = self.category_counts
+        observed[:, 1] = self._count_categories(codes, n_categories)
+
+        present = observed.sum(axis=1) > 0
+        expected = observed.sum(axis=2, keepdims=True) * observed.sum(axis=1, keepdims=True) \
+            / observed.sum(axis=(1, 2), keepdims=True)
+        dof = present.sum(axis=1) - 1
+
+        # Yates' correction for continuity for 2x2 tables
+        yates = (dof == 1)[:, None, None]
+        diff = expected - observed
+        observed = np.where(yates, observed + np.minimum(0.5, np.abs(diff)) * np.sign(diff), observed)
+        with np.errstate(invalid="ignore"):
+            terms = (observed - expected)**2 / expected
+        # Sum over the categories present in the same order as scipy
+        stat = np.array([terms[feat][:, present[feat]].ravel().sum() for feat in range(len(terms))])
+        return np.where(dof > 0, chi2.sf(stat, np.maximum(dof, 1)), 1.)
+
+    def predict(self, X):
+        return self.predict_transformed(self._preprocess(X))
+
+    def predict_transformed(self, X):
+        threshold = self.p_value / self.n_features
+        drift_pred = int((np.array(self.test_transformed(X)) < threshold).any())
+        return drift_pred
+
+class DriftWindow:
+    """
+    Collects preprocessed inputs in a preallocated buffer of `window_size`
+    rows. Each time the buffer is full, the window is evaluated with
+    `evaluate` (e.g. `DriftDetector.predict_transformed`) and `on_result` is
+    called with the result. Evaluation and the optional snapshots of the
+    windows in `snapshot_dir` run in a background thread, so `add` only
+    copies the rows. Rows added after `close` are ignored.
+    """
+    def __init__(self, evaluate, n_features, window_size=100, on_result=None, snapshot_dir=None):
+        self.evaluate = evaluate
+        self.window_size = window_size
+        self.on_result = on_result
+        self.snapshot_dir = snapshot_dir
+        self._buffer = np.empty((window_size, n_features))
+        self._n_rows = 0
+        self._lock = Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drift")
+
+    def add(self, X):
+        """Append the rows of `X` to the window."""
+        with self._lock:
+            if self._closed:
+                return
+            start = 0
+            while start < len(X):
+                n_rows = min(self.window_size - self._n_rows, len(X) - start)
+                self._buffer[self._n_rows:self._n_rows + n_rows] = X[start:start + n_rows]
+                self._n_rows += n_rows
+                start += n_rows
+                if self._n_rows == self.window_size:
+                    self._executor.submit(self._evaluate, self._buffer.copy())
+                    self._n_rows = 0
+
+    def _evaluate(self, window):
+        try:
+            if self.snapshot_dir is not None:
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                np.save(os.path.join(self.snapshot_dir, f"window_{time.time_ns()}.npy"), window)
+            result = self.evaluate(window)
+            if self.on_result is not None:
+                self.on_result(result)
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Drift evaluation failed")
+
+    def close(self):
+        """Wait for pending evaluations and stop the background thread."""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,122 @@
+"""
+Module for computing explanations in worker processes.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sklearn.pipeline import Pipeline
+
+from predict_titanic_survival.artifacts import load_artifact
+from predict_titanic_survival.compiled import compile_model
+
+# Artifacts of the worker process, loaded once by `_load_artifacts`
+_preprocessor = None
+_classifier = None
+_explainer = None
+_load_seconds = None
+
+def _load_artifacts(model_path, explainer_path, mmap_dir):
+    global _preprocessor, _classifier, _explainer, _load_seconds # pylint: disable=global-statement
+    start = time.perf_counter()
+    pipeline = load_artifact(model_path, mmap_dir)
+    _preprocessor = Pipeline(pipeline.steps[:-1])
+    _classifier = compile_model(pipeline.steps[-1][1])
+    _explainer = load_artifact(explainer_path, mmap_dir)
+    _load_seconds = time.perf_counter() - start
+
+def _ping():
+    return _load_seconds
+
+def _explain(record):
+    X_tf = _preprocessor.transform(pd.DataFrame([record]))
+    explanation = _explainer.explain_instance(X_tf[0], _classifier.predict_proba)
+    return explanation.as_list()
+
+class ExplainerPool:
+    """
+    Explains input records with the LIME explainer in a pool of
+    `max_workers` processes, so explanations do not block the event loop
+    or the GIL of the serving process. Each worker loads the model and the
+    explainer once when it is started (memory-mapped from `mmap_dir`, see
+    `load_artifact`).
+
+    At most `max_concurrency_per_worker` explanations per worker are handed
+    to the pool at a time, further requests wait in `submit`. `waiting` and
+    `running` give the current queue depth, `on_change` is called with both
+    whenever they change.
+    """
+    def __init__(self, model_path, explainer_path, max_workers=2, max_concurrency_per_worker=1,
+                 on_change=None, mmap_dir=None):
+        self.model_path = model_path
+        self.explainer_path = explainer_path
+        self.max_workers = max_workers
+        self.max_concurrency = max_workers * max_concurrency_per_worker
+        self.waiting = 0
+        self.running = 0
+        self.on_change = on_change
+        self.mmap_dir = mmap_dir
+        self.load_seconds = None
+        self._executor = None
+        self._semaphore = None
+        self._ready = None
+
+    async def start(self, wait=True):
+        """
+        Start the worker processes. With `wait`, wait until they have loaded
+        the artifacts, otherwise they load in the background and `submit`
+        waits for them.
+        """
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            # Do not fork the threads of the serving process
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_artifacts,
+            initargs=(self.model_path, self.explainer_path, self.mmap_dir),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready = asyncio.ensure_future(self._warm_up())
+        if wait:
+            await self._ready
+
+    async def _warm_up(self):
+        loop = asyncio.get_running_loop()
+        self.load_seconds = max(await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _ping) for _ in range(self.max_workers)]))
+
+    @property
+    def ready(self):
+        """Whether all workers have loaded the artifacts."""
+        return self._ready is not None and self._ready.done() and not self._ready.cancelled() \
+            and self._ready.exception() is None
+
+    async def wait_ready(self):
+        await asyncio.shield(self._ready)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def submit(self, record):
+        """Explain `record` and return the list of (characteristic, contribution)."""
+        self._update(waiting=1)
+        try:
+            await self.wait_ready()
+            await self._semaphore.acquire()
+        finally:
+            self._update(waiting=-1)
+        self._update(running=1)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _explain, record)
+        finally:
+            self._update(running=-1)
+            self._semaphore.release()
+
+    def _update(self, waiting=0, running=0):
+        self.waiting += waiting
+        self.running += running
+        if self.on_change is not None:
+            self.on_change(self.waiting, self.running)
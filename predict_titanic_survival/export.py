@@ -0,0 +1,161 @@
+"""
+Module for exporting the model for serving.
+
+The trained model ends with a fairlearn `GridSearch`, which keeps the
+classifiers of all Lagrange multipliers of its grid in `predictors_`,
+although it only predicts with `predictors_[best_idx_]`. `slim_model`
+replaces it by a `SelectedPredictor` with only this classifier, compiled to
+a `CompiledTreeEnsemble` (calibrated on the data the export is checked
+with), and a small record of the search for auditing:
+
+    python -m predict_titanic_survival.export models/model.pkl models/model.pkl \\
+        --data data/interim/test_df.arrow
+"""
+
+import argparse
+import io
+import json
+import os
+import pickle
+import time
+
+import cloudpickle
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.pipeline import Pipeline
+from sklearn.utils import _safe_indexing
+
+from predict_titanic_survival.compiled import CompiledTreeEnsemble, compile_model
+from predict_titanic_survival.dataset import load_dataset
+
+class SelectedPredictor(BaseEstimator, ClassifierMixin):
+    """
+    The predictor selected by a fitted fairlearn `GridSearch`, which predicts
+    as the search, with the `metadata` of the search (see `search_metadata`).
+
+    Like the search, it exposes the predictor as `predictors_[best_idx_]`.
+    """
+    def __init__(self, predictor, metadata=None):
+        self.predictor = predictor
+        self.metadata = metadata
+
+    @property
+    def predictors_(self):
+        return [self.predictor]
+
+    @property
+    def best_idx_(self):
+        return 0
+
+    @property
+    def classes_(self):
+        return self.predictor.classes_
+
+    def predict(self, X):
+        return self.predictor.predict(X)
+
+    def predict_proba(self, X):
+        return self.predictor.predict_proba(X)
+
+def search_metadata(mitigator):
+    """
+    JSON serializable record of a fitted fairlearn `GridSearch`: the Lagrange
+    multipliers, objectives, constraint violations and losses of all grid
+    points and the index of the selected one.
+    """
+    def records(df):
+        return [{"index": [str(level) for level in (key if isinstance(key, tuple) else (key,))],
+                 "values": [float(value) for value in row]}
+                for key, row in zip(df.index, df.values)]
+
+    losses = [mitigator.objective_weight * objective + mitigator.constraint_weight * mitigator.gammas_[column].max()
+              for objective, column in zip(mitigator.objectives_, mitigator.lambda_vecs_.columns)]
+    return {
+        "constraints": type(mitigator.constraints).__name__,
+        "constraint_weight": mitigator.constraint_weight,
+        "best_idx": int(mitigator.best_idx_),
+        "lambda_vec": records(mitigator.lambda_vecs_.iloc[:, [mitigator.best_idx_]]),
+        "lambda_vecs": records(mitigator.lambda_vecs_),
+        "objectives": [float(objective) for objective in mitigator.objectives_],
+        "gammas": records(mitigator.gammas_),
+        "losses": [float(loss) for loss in losses],
+    }
+
+def slim_model(pipeline, X=None):
+    """
+    `pipeline` with its final fairlearn `GridSearch` replaced by a
+    `SelectedPredictor`. With input rows `X`, the `max_rows` of the compiled
+    classifier is calibrated on them.
+    """
+    name, mitigator = pipeline.steps[-1]
+    if not (hasattr(mitigator, "predictors_") and hasattr(mitigator, "best_idx_")):
+        raise TypeError(f"{type(mitigator).__name__} is not a fitted fairlearn GridSearch")
+    predictor = compile_model(mitigator.predictors_[mitigator.best_idx_])
+    if X is not None and isinstance(predictor, CompiledTreeEnsemble):
+        predictor.calibrate(Pipeline(pipeline.steps[:-1]).transform(_safe_indexing(X, slice(0, 256))))
+    selected = SelectedPredictor(predictor, search_metadata(mitigator))
+    return Pipeline(pipeline.steps[:-1] + [(name, selected)])
+
+def check_identical(model, slim, X, max_rows=None):
+    """
+    Raise a ValueError unless `slim` predicts exactly the same as `model` for
+    `X`, as a whole and in batches of every size from 1 to `max_rows` rows
+    (default: the `max_rows` of the `CompiledTreeEnsemble` of `slim`, up to
+    which it predicts differently than the classifier).
+
+    If both are pipelines with the same preprocessing steps, `X` is
+    preprocessed once and only their final steps are compared.
+    """
+    if (isinstance(model, Pipeline) and isinstance(slim, Pipeline) and len(model.steps) > 1
+            and len(model.steps) == len(slim.steps)
+            and all(step is slim_step for (_, step), (_, slim_step) in zip(model.steps[:-1], slim.steps[:-1]))):
+        X = Pipeline(model.steps[:-1]).transform(X)
+        model, slim = model.steps[-1][1], slim.steps[-1][1]
+    if max_rows is None:
+        final_step = slim.steps[-1][1] if isinstance(slim, Pipeline) else slim
+        max_rows = getattr(compile_model(final_step), "max_rows", 32)
+    batches = [(len(X), X)] + [(batch_size, _safe_indexing(X, slice(start, start + batch_size)))
+                               for batch_size in range(1, max_rows + 1)
+                               for start in range(0, len(X), batch_size)]
+    for batch_size, batch in batches:
+        for method in ("predict", "predict_proba"):
+            expected = getattr(model, method)(batch)
+            actual = getattr(slim, method)(batch)
+            if expected.shape != actual.shape or not np.array_equal(expected, actual):
+                raise ValueError(f"{method} of the slim model differs from the full model "
+                                 f"in batches of {batch_size} rows")
+
+def artifact_stats(model, repeats=5):
+    """Pickled size in bytes and median unpickling time in seconds of `model`."""
+    data = cloudpickle.dumps(model)
+    load_times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pickle.load(io.BytesIO(data))
+        load_times.append(time.perf_counter() - start)
+    return {"bytes": len(data), "load_s": float(np.median(load_times))}
+
+def export_model(model, output_path, X):
+    """
+    Write the slim version of `model` to `output_path` after checking its
+    predictions on `X`. Returns the size and load time of both versions.
+    """
+    slim = slim_model(model, X)
+    check_identical(model, slim, X)
+    report = {"full": artifact_stats(model), "slim": artifact_stats(slim)}
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as f:
+        cloudpickle.dump(slim, f)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("model", help="Pickled model with a fairlearn GridSearch as final step")
+    parser.add_argument("output", help="File for the slim model (may be the same as model)")
+    parser.add_argument("--data", required=True, help="Dataset to check the predictions on")
+    args = parser.parse_args()
+
+    with open(args.model, "rb") as f:
+        full_model = pickle.load(f)
+    data = load_dataset(args.data).drop(columns=["label"], errors="ignore")
+    print(json.dumps(export_model(full_model, args.output, data), indent=2))
@@ -0,0 +1,244 @@
+"""
+Module with imputers for sklearn pipelines.
+"""
+
+import warnings
+import numpy as np
+from sklearn.impute import KNNImputer
+from sklearn.neighbors import KDTree
+from sklearn.neighbors._base import _get_weights
+from sklearn.utils import is_scalar_nan
+from sklearn.utils._mask import _get_mask
+from sklearn.utils.validation import FLOAT_DTYPES, check_is_fitted
+
+def _nan_euclidean_exact(X, Y):
+    """
+    nan-euclidean distances between the rows of `X` and `Y` (see
+    `sklearn.metrics.pairwise.nan_euclidean_distances`), computed coordinate
+    by coordinate instead of with matrix products, so they do not depend on
+    the BLAS or on the other rows.
+    """
+    present = ~np.isnan(X)[:, np.newaxis, :] & ~np.isnan(Y)[np.newaxis, :, :]
+    diff = np.where(present, X[:, np.newaxis, :] - Y[np.newaxis, :, :], 0.)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt((diff * diff).sum(axis=2) * (X.shape[1] / present.sum(axis=2)))
+
+class IndexedKNNImputer(KNNImputer):
+    """
+    Drop-in replacement for `KNNImputer` which looks up the nearest neighbours
+    in KD-trees instead of computing the distances to all stored rows.
+
+    The training rows are grouped by their missing-value pattern. For a
+    receiver with missing-value pattern P and a group of donors with pattern Q,
+    the nan-euclidean distance is the euclidean distance on the columns present
+    in both, scaled by a constant. Hence one KD-tree per pair (P, Q) yields the
+    exact neighbours. The trees for the patterns seen during `fit` are built at
+    fit time (and again when unpickling), further patterns are indexed on
+    first use.
+
+    If the k-th and (k+1)-th neighbour of a row are (nearly) tied, or a row
+    has too few donors, the row is imputed as by `KNNImputer.transform`, with
+    the distances to all stored rows computed by `_nan_euclidean_exact`.
+    Hence the result is the one of `KNNImputer(metric=...)` with exactly
+    computed nan-euclidean distances, up to the rounding of the (weighted)
+    means, and it does not depend on the other rows of the batch. `KNNImputer`
+    itself computes the distances with matrix products, whose rounding
+    depends on the BLAS (on some builds by far more than the float
+    precision), and may then pick another of two donors whose distances
+    differ by less than this error. Only `metric="nan_euclidean"` with
+    `missing_values=np.nan` is indexed, other settings fall back to
+    `KNNImputer` entirely.
+    """
+    def __init__(
+        self,
+        *,
+        missing_values=np.nan,
+        n_neighbors=5,
+        weights="uniform",
+        metric="nan_euclidean",
+        copy=True,
+        add_indicator=False,
+        keep_empty_features=False,
+        leaf_size=40,
+    ):
+        super().__init__(
+            missing_values=missing_values,
+            n_neighbors=n_neighbors,
+            weights=weights,
+            metric=metric,
+            copy=copy,
+            add_indicator=add_indicator,
+            keep_empty_features=keep_empty_features,
+        )
+        self.leaf_size = leaf_size
+
+    def _is_indexed(self):
+        return (
+            self.metric == "nan_euclidean"
+            and self.weights in ("uniform", "distance")
+            and is_scalar_nan(self.missing_values)
+        )
+
+    def fit(self, X, y=None):
+        super().fit(X, y)
+        if self._is_indexed():
+            self._build_index()
+        return self
+
+    def _build_index(self):
+        self._donor_patterns, donor_group = np.unique(self._mask_fit_X, axis=0, return_inverse=True)
+        self._donor_groups = [np.flatnonzero(donor_group == g) for g in range(len(self._donor_patterns))]
+        self._trees = {}
+        receiver_patterns = np.unique(self._mask_fit_X[self._mask_fit_X.any(axis=1)], axis=0)
+        for pattern in receiver_patterns:
+            for group in range(len(self._donor_groups)):
+                self._trees[(group, pattern.tobytes())] = self._build_tree(group, pattern)
+
+    def __getstate__(self):
+        # The trees are rebuilt from `_fit_X` when unpickling. This keeps the
+        # artifact small and its hash independent of queries and lazily
+        # indexed patterns.
+        state = dict(super().__getstate__())
+        for key in ("_donor_patterns", "_donor_groups", "_trees"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if hasattr(self, "_fit_X") and self._is_indexed():
+            self._build_index()
+
+    def _build_tree(self, group, pattern):
+        present = np.flatnonzero(~pattern & ~self._donor_patterns[group])
+        if not present.size:
+            return None, present
+        data = self._fit_X[np.ix_(self._donor_groups[group], present)]
+        return KDTree(data, leaf_size=self.leaf_size), present
+
+    def _get_tree(self, group, pattern):
+        key = (group, pattern.tobytes())
+        tree = self._trees.get(key)
+        if tree is None:
+            tree = self._trees[key] = self._build_tree(group, pattern)
+        return tree
+
+    def transform(self, X):
+        if not self._is_indexed() or not hasattr(self, "_trees"):
+            return super().transform(X)
+        check_is_fitted(self)
+        X = self._validate_data(
+            X,
+            accept_sparse=False,
+            dtype=FLOAT_DTYPES,
+            force_all_finite="allow-nan",
+            copy=self.copy,
+            reset=False,
+        )
+        mask = _get_mask(X, self.missing_values)
+        if not np.any(mask):
+            return self._transform_brute_force(X)
+
+        row_missing_idx = np.flatnonzero(mask.any(axis=1))
+        X_missing = X[row_missing_idx]
+        fallback = np.zeros(X.shape[0], dtype=bool)
+        patterns, pattern_idx = np.unique(mask[row_missing_idx], axis=0, return_inverse=True)
+        for p, pattern in enumerate(patterns):
+            self._impute_pattern(X, row_missing_idx[pattern_idx == p], pattern, fallback)
+        if fallback.any():
+            self._impute_exact(X, np.flatnonzero(fallback), X_missing[fallback[row_missing_idx]])
+
+        X_indicator = self._transform_indicator(mask)
+        if self.keep_empty_features:
+            Xc = X
+            Xc[:, ~self._valid_mask] = 0
+        else:
+            Xc = X[:, self._valid_mask]
+        return self._concatenate_indicator(Xc, X_indicator)
+
+    def _transform_brute_force(self, X):
+        with warnings.catch_warnings():
+            # X is already validated and has lost its feature names
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            return super().transform(X)
+
+    def _impute_exact(self, X, rows, X_rows):
+        """
+        Impute the rows `rows` of `X` in place as `KNNImputer.transform` does,
+        with exactly computed distances. `X_rows` are these rows before
+        imputation.
+        """
+        mask_rows = np.isnan(X_rows)
+        # Rows per chunk, so that the temporary arrays have about 4M entries
+        chunk_size = max(1, 2**22 // self._fit_X.size)
+        dist = np.vstack([_nan_euclidean_exact(X_rows[start:start + chunk_size], self._fit_X)
+                          for start in range(0, len(rows), chunk_size)])
+        for col in np.flatnonzero(mask_rows.any(axis=0) & self._valid_mask):
+            receivers = np.flatnonzero(mask_rows[:, col])
+            potential_donors = np.flatnonzero(~self._mask_fit_X[:, col])
+            dist_subset = dist[np.ix_(receivers, potential_donors)]
+            # Receivers without any defined distance get the column mean
+            all_nan = np.isnan(dist_subset).all(axis=1)
+            if all_nan.any():
+                X[rows[receivers[all_nan]], col] = np.ma.array(
+                    self._fit_X[:, col], mask=self._mask_fit_X[:, col]).mean()
+                receivers, dist_subset = receivers[~all_nan], dist_subset[~all_nan]
+            if receivers.size:
+                X[rows[receivers], col] = self._calc_impute(
+                    dist_subset,
+                    min(self.n_neighbors, len(potential_donors)),
+                    self._fit_X[potential_donors, col],
+                    self._mask_fit_X[potential_donors, col],
+                )
+
+    def _impute_pattern(self, X, rows, pattern, fallback):
+        """Impute all rows with missing-value pattern `pattern` in place."""
+        cols = np.flatnonzero(pattern & self._valid_mask)
+        if not cols.size:
+            return
+        n_neighbors = self.n_neighbors
+        X_rows = X[rows]
+        # Bound for the rounding error of the distances computed by KNNImputer
+        # for neighbours of the rows
+        sq_norm = np.nansum(X_rows**2, axis=1)
+
+        # nearest donors per donor group, sorted by distance
+        candidates = []
+        for group, donor_idx in enumerate(self._donor_groups):
+            tree, present = self._get_tree(group, pattern)
+            if tree is None:
+                candidates.append(None)
+                continue
+            dist, ind = tree.query(X_rows[:, present], k=min(n_neighbors + 1, len(donor_idx)))
+            sq_dist = dist**2 * (X.shape[1] / present.size)
+            candidates.append((sq_dist, donor_idx[ind]))
+
+        for col in cols:
+            groups = [
+                group for group, candidate in enumerate(candidates)
+                if candidate is not None and not self._donor_patterns[group][col]
+            ]
+            n_donors = sum(len(self._donor_groups[group]) for group in groups)
+            if n_donors <= n_neighbors:
+                # Donors without common features or n_neighbors > n_donors
+                fallback[rows] = True
+                continue
+            sq_dist = np.hstack([candidates[group][0] for group in groups])
+            donors = np.hstack([candidates[group][1] for group in groups])
+            order = np.argsort(sq_dist, axis=1, kind="stable")[:, :n_neighbors + 1]
+            sq_dist = np.take_along_axis(sq_dist, order, axis=1)
+            donors = np.take_along_axis(donors, order, axis=1)[:, :n_neighbors]
+
+            tol = 1e-13 * X.shape[1] * (1 + 3 * sq_norm + 2 * sq_dist[:, n_neighbors])
+            tied = sq_dist[:, n_neighbors] - sq_dist[:, n_neighbors - 1] <= tol
+            if self.weights == "distance":
+                # Inverse distances of (nearly) identical rows are unstable
+                tied |= sq_dist[:, 0] <= tol
+            fallback[rows[tied]] = True
+
+            weights = _get_weights(np.sqrt(sq_dist[:, :n_neighbors]), self.weights)
+            if weights is None:
+                value = self._fit_X[donors, col].mean(axis=1)
+            else:
+                weights[np.isnan(weights)] = 0.
+                value = np.average(self._fit_X[donors, col], axis=1, weights=weights)
+            X[rows, col] = value
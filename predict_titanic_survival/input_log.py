@@ -0,0 +1,112 @@
+"""
+Module for logging the model inputs to SQLite.
+"""
+
+import itertools
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from threading import Condition, Thread
+
+logger = logging.getLogger(__name__)
+
+class InputLogWriter:
+    """
+    Appends rows to a SQLite table from a dedicated writer thread.
+
+    `log` only puts the rows into a bounded in-memory queue. The writer thread
+    keeps one connection in WAL mode and inserts the queued rows with
+    `executemany`, committing whenever `batch_size` rows are pending or
+    `flush_interval` seconds have passed. If more than `max_pending` rows are
+    waiting, further rows are dropped instead of blocking the caller.
+
+    `on_pending` is called with the number of pending rows whenever it
+    changes, `on_flush` with the number of rows and the duration of each
+    write.
+    """
+    def __init__(self, path, columns, table="Input", batch_size=500, flush_interval=0.2,
+                 max_pending=100_000, on_flush=None, on_pending=None):
+        self.path = path
+        self.columns = list(columns)
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+        self.on_pending = on_pending
+        self.pending = 0
+        self.dropped = 0
+        self._chunks = deque()
+        self._condition = Condition()
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="input-log", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def log(self, rows):
+        """
+        Enqueue `rows` (sequence of tuples in the order of `columns`).
+        Returns False if the rows were dropped because the queue is full.
+        """
+        with self._condition:
+            if self.pending + len(rows) > self.max_pending:
+                self.dropped += len(rows)
+                return False
+            self._chunks.append(rows)
+            self.pending += len(rows)
+            self._notify_pending()
+            if self.pending >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def close(self):
+        """Write all pending rows and stop the writer thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _notify_pending(self):
+        if self.on_pending is not None:
+            self.on_pending(self.pending)
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=15, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        column_list = ", ".join(f'"{column}"' for column in self.columns)
+        con.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({column_list})')
+        return con, f'INSERT INTO "{self.table}" ({column_list}) VALUES ({", ".join("?" * len(self.columns))})'
+
+    def _run(self):
+        con, insert = self._connect()
+        while True:
+            with self._condition:
+                if not self._stopping and self.pending < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                chunks = list(self._chunks)
+                n_rows = self.pending
+                self._chunks.clear()
+                self.pending = 0
+                if n_rows:
+                    self._notify_pending()
+                stopping = self._stopping
+            if chunks:
+                start = time.perf_counter()
+                try:
+                    con.executemany(insert, itertools.chain.from_iterable(chunks))
+                    con.commit()
+                except sqlite3.Error:
+                    logger.exception("Writing %d rows to %s failed", n_rows, self.path)
+                    con.rollback()
+                else:
+                    if self.on_flush is not None:
+                        self.on_flush(n_rows, time.perf_counter() - start)
+            if stopping and not chunks:
+                break
+        con.close()
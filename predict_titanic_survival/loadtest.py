@@ -0,0 +1,182 @@
+"""
+Module for load testing the model API.
+
+Replays the payloads of a JSONL file against a running API with a given
+concurrency, optionally at a fixed request rate, and reports latency
+percentiles, throughput and error rates as JSON:
+
+    python app.py &
+    python -m predict_titanic_survival.loadtest data/load_test/payloads.jsonl \\
+        --concurrency 32 --duration 30
+
+Each line of the payload file is either a request
+`{"path": "/explain", "params": {"method": "tree"}, "json": {...}}` or just
+the JSON body, which is sent to `--path` (grouped into lists of
+`--batch-size` bodies, e.g. for `/predict_batch`).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+PERCENTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+def read_payloads(path, default_path="/predict", batch_size=1):
+    """Read the requests of a JSONL file as dicts with `path`, `params` and `json`."""
+    requests = []
+    bodies = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            if isinstance(payload, dict) and "json" in payload:
+                requests.append({
+                    "path": payload.get("path", default_path),
+                    "params": payload.get("params"),
+                    "json": payload["json"],
+                })
+            else:
+                bodies.append(payload)
+    if batch_size > 1:
+        bodies = [bodies[start:start + batch_size] for start in range(0, len(bodies), batch_size)]
+    requests.extend({"path": default_path, "params": None, "json": body} for body in bodies)
+    if not requests:
+        raise ValueError(f"No payloads in {path}")
+    return requests
+
+def write_payloads(records, path, endpoint=None, params=None):
+    """
+    Append `records` (e.g. `df.to_dict(orient="records")`) to the JSONL file
+    at `path`, as plain bodies or as requests to `endpoint`. NaN is written
+    as null.
+    """
+    with open(path, "a") as f:
+        for record in records:
+            record = {key: None if isinstance(value, float) and math.isnan(value) else value
+                      for key, value in record.items()}
+            if endpoint is not None:
+                record = {"path": endpoint, "params": params, "json": record}
+            f.write(json.dumps(record) + "\n")
+
+class _Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def summary(self, elapsed):
+        latencies = np.array(self.latencies) * 1000
+        n_errors = sum(self.errors.values())
+        summary = {
+            "requests": len(latencies),
+            "throughput_per_s": len(latencies) / elapsed,
+            "error_rate": n_errors / len(latencies) if len(latencies) else 0.0,
+            "errors": dict(self.errors),
+        }
+        if len(latencies):
+            summary["latency_ms"] = {
+                **{name: float(np.percentile(latencies, q)) for name, q in PERCENTILES.items()},
+                "mean": float(latencies.mean()),
+                "max": float(latencies.max()),
+            }
+        return summary
+
+async def run_load_test(base_url, requests, concurrency=10, rate=None, duration=10.0, n_requests=None,
+                        timeout=30.0):
+    """
+    Send the `requests` (see `read_payloads`) in a cycle to the API at
+    `base_url` from `concurrency` concurrent clients sharing a pool of
+    keep-alive connections, for `duration` seconds or until `n_requests`
+    requests have been sent.
+
+    Without `rate`, every client sends its next request as soon as the
+    previous one is answered. With `rate`, requests are started at `rate`
+    requests per second and their latency is measured from the scheduled
+    start, so waiting for a free client counts into the latency.
+
+    Returns a report with the latency percentiles in milliseconds,
+    throughput and error rates per path and in total.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    stats = {}
+    total = _Stats()
+    counter = itertools.count()
+    start = time.perf_counter()
+    deadline = start + duration if duration is not None else math.inf
+
+    async def send(client, request, scheduled):
+        try:
+            response = await client.post(request["path"], params=request["params"], json=request["json"])
+            error = None if response.status_code < 400 else str(response.status_code)
+        except httpx.HTTPError as exc:
+            error = type(exc).__name__
+        latency = time.perf_counter() - scheduled
+        for path_stats in (stats.setdefault(request["path"], _Stats()), total):
+            path_stats.latencies.append(latency)
+            if error is not None:
+                path_stats.errors[error] += 1
+
+    async def run_client(client):
+        while True:
+            i = next(counter)
+            if n_requests is not None and i >= n_requests:
+                return
+            if rate is None:
+                scheduled = time.perf_counter()
+            else:
+                scheduled = start + i / rate
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            if scheduled >= deadline:
+                return
+            await send(client, requests[i % len(requests)], scheduled)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await asyncio.gather(*[run_client(client) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "base_url": base_url,
+        "concurrency": concurrency,
+        "rate": rate,
+        "elapsed_s": elapsed,
+        "total": total.summary(elapsed),
+        "paths": {path: path_stats.summary(elapsed) for path, path_stats in stats.items()},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    parser.add_argument("payloads", help="JSONL file with the payloads")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="Base URL of the API")
+    parser.add_argument("--path", default="/predict", help="Endpoint for plain bodies")
+    parser.add_argument("--batch-size", type=int, default=1, help="Bodies per request for plain bodies")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients")
+    parser.add_argument("--rate", type=float, help="Requests per second (default: as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Duration in seconds")
+    parser.add_argument("--requests", type=int, help="Stop after this number of requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout per request in seconds")
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(
+        args.url,
+        read_payloads(args.payloads, args.path, args.batch_size),
+        concurrency=args.concurrency,
+        rate=args.rate,
+        duration=args.duration,
+        n_requests=args.requests,
+        timeout=args.timeout,
+    ))
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
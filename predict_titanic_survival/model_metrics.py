@@ -0,0 +1,48 @@
+"""
+Module for Prometheus metrics of the model outputs.
+"""
+
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+class ModelOutputMetrics:
+    """
+    Histograms of the predicted scores and outlier scores (shifted by +1)
+    and a counter of the predicted labels. `observe` records a whole batch
+    of predictions, with one update per label.
+    """
+    def __init__(self, namespace="", subsystem=""):
+        self.score = Histogram(
+            "model_score",
+            "Predicted score of model",
+            buckets=(0, .1, .2, .3, .4, .5, .6, .7, .8, .9),
+            namespace=namespace,
+            subsystem=subsystem,
+        )
+        self.outlier_score = Histogram(
+            "outlier_score",
+            "Outlier score of data (shifted by +1.)",
+            buckets=np.round(np.arange(0,1.9, 0.1), 1),
+            namespace=namespace,
+            subsystem=subsystem,
+        )
+        self.label = Counter(
+            "label",
+            "Predicted label",
+            namespace=namespace,
+            subsystem=subsystem,
+            labelnames=("label",)
+        )
+
+    def observe(self, labels, scores, outlier_scores):
+        """Record the labels, scores and outlier scores of a batch of predictions."""
+        self._observe_histogram(self.score, np.asarray(scores, dtype=float))
+        self._observe_histogram(self.outlier_score, np.asarray(outlier_scores, dtype=float) + 1)
+        values, counts = np.unique(np.asarray(labels), return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.label.labels(str(value)).inc(count)
+
+    @staticmethod
+    def _observe_histogram(histogram, values):
+        for value in values.tolist():
+            histogram.observe(value)
@@ -0,0 +1,39 @@
+"""
+Module for the outlier detector artifact.
+"""
+
+import joblib
+from sklearn.pipeline import Pipeline
+
+class OutlierDetector:
+    """
+    Outlier detector that is fitted on the output of the model's preprocessor.
+
+    The detector only consists of the scaler and the estimator. The hash of the
+    preprocessor it was fitted on is stored with the artifact, so that a
+    service can check whether it may feed the matrix already transformed for
+    the classifier directly into `detector`.
+    """
+    def __init__(self, preprocessor, detector):
+        self.preprocessor = preprocessor
+        self.detector = detector
+        self.preprocessor_hash = joblib.hash(preprocessor)
+
+    @classmethod
+    def from_pipeline(cls, pipeline, n_detector_steps=2):
+        """
+        Split a pipeline `preprocessor.steps + [("sd", ...), ("od", ...)]`
+        (the former artifact format) into preprocessor and detector.
+        """
+        return cls(Pipeline(pipeline.steps[:-n_detector_steps]),
+                   Pipeline(pipeline.steps[-n_detector_steps:]))
+
+    def shares_preprocessor(self, preprocessor):
+        """True if `preprocessor` is identical to the fitted preprocessor of the detector."""
+        return joblib.hash(preprocessor) == self.preprocessor_hash
+
+    def decision_function(self, X):
+        return self.detector.decision_function(self.preprocessor.transform(X))
+
+    def predict(self, X):
+        return self.detector.predict(self.preprocessor.transform(X))
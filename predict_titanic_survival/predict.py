@@ -1,18 +1,134 @@
 #!/bin/python
 """
-Skript um Vorhersage des Modells zu testen
+Skript zum Scoren großer Datenmengen mit dem trainierten Modell (ohne API)
+
+Die Eingaben (CSV, Arrow, Parquet oder Pickle) werden in Chunks gelesen und in
+mehreren Worker-Prozessen bewertet, die Modell und Outlier Detektor je
+einmal laden. Die Ergebnisse werden um die Spalten `score`, `label` und
+`outlier_score` ergänzt und fortlaufend in eine Parquet-Datei geschrieben.
 
 Ausführen:
 ```
-python predict.py
+python -m predict_titanic_survival.predict data/interim/test_df.arrow data/scored.parquet --workers 4
 ```
 """
 
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import joblib
+import numpy as np
 import pandas as pd
+from sklearn.pipeline import Pipeline
+
+from predict_titanic_survival.artifacts import load_artifact
+from predict_titanic_survival.compiled import compile_model
+from predict_titanic_survival.outlier import OutlierDetector
+
+# Artefakte des Worker-Prozesses, geladen von `_load_models`
+_preprocessor = None
+_classifier = None
+_outlier_detector = None
+_share_preprocessing = None
+
+def _load_models(model_path, outlier_detector_path, mmap_dir):
+    global _preprocessor, _classifier, _outlier_detector, _share_preprocessing # pylint: disable=global-statement
+    pipeline = load_artifact(model_path, mmap_dir)
+    _preprocessor = Pipeline(pipeline.steps[:-1])
+    _classifier = compile_model(pipeline.steps[-1][1])
+    _outlier_detector = load_artifact(outlier_detector_path, mmap_dir)
+    if isinstance(_outlier_detector, Pipeline):
+        _outlier_detector = OutlierDetector.from_pipeline(_outlier_detector)
+    _share_preprocessing = _outlier_detector.shares_preprocessor(_preprocessor)
+
+def _score_chunk(df):
+    """Append `score`, `label` and `outlier_score` to `df` (as in the API)."""
+    X_tf = _preprocessor.transform(df)
+    pred_probas = _classifier.predict_proba(X_tf)
+    if _share_preprocessing:
+        decision = _outlier_detector.detector.decision_function(X_tf)
+    else:
+        decision = _outlier_detector.decision_function(df)
+    labels = np.argmax(pred_probas, axis=1)
+    return df.assign(
+        score=pred_probas[np.arange(len(df)), labels],
+        label=labels,
+        outlier_score=np.maximum(-2, decision/2),
+    )
+
+def read_chunks(path, chunksize):
+    """Read the DataFrame at `path` (.csv, .arrow, .parquet or pickle) in chunks
+    of `chunksize` rows. Pickled DataFrames can only be read as a whole."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        yield from pd.read_csv(path, chunksize=chunksize)
+    elif extension in (".arrow", ".feather"):
+        import pyarrow as pa # pylint: disable=import-outside-toplevel
+        # Memory-mapped, the chunks are only read when they are converted
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    elif extension in (".parquet", ".pq"):
+        import pyarrow.parquet as pq # pylint: disable=import-outside-toplevel
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        df = pd.read_pickle(path)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+def score_file(input_path, output_path, models_dir="models", workers=None, chunksize=50_000,
+               mmap_dir=None):
+    """
+    Score all rows of `input_path` in `workers` processes (default: all
+    cores) and write them with the columns `score`, `label` and
+    `outlier_score` to the Parquet file `output_path`, in the order of the
+    input. At most two chunks per worker are in flight, so the memory does
+    not grow with the size of the input. Returns the number of rows and
+    the rows per second.
+    """
+    import pyarrow as pa # pylint: disable=import-outside-toplevel
+    import pyarrow.parquet as pq # pylint: disable=import-outside-toplevel
+    workers = workers or os.cpu_count()
+    start = time.perf_counter()
+    n_rows = 0
+    writer = None
+    pending = deque()
+
+    def write(df):
+        nonlocal writer, n_rows
+        if writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            writer = pq.ParquetWriter(output_path, table.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        n_rows += len(df)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_load_models,
+        initargs=(os.path.join(models_dir, "model.pkl"),
+                  os.path.join(models_dir, "outlier_detector.pkl"), mmap_dir),
+    ) as executor:
+        try:
+            for chunk in read_chunks(input_path, chunksize):
+                pending.append(executor.submit(_score_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+        finally:
+            if writer is not None:
+                writer.close()
+    seconds = time.perf_counter() - start
+    return {"rows": n_rows, "seconds": seconds, "rows_per_s": n_rows / seconds if seconds else 0.0}
 
 def predict():
-    """Beispiel Funktion zur Vorhersage mit 
+    """Beispiel Funktion zur Vorhersage mit
     trainiertem Modell"""
     clf = joblib.load("models/model.pkl")
 
@@ -29,4 +145,13 @@ def predict():
     print(f"prediction: {clf.predict(features.iloc[0:1])[0]}")
 
 if __name__ == "__main__":
-    predict()
+    parser = argparse.ArgumentParser(description="Score a CSV, Arrow, Parquet or pickle file with the model")
+    parser.add_argument("input", help="Input file (.csv, .arrow, .parquet or pickled DataFrame)")
+    parser.add_argument("output", help="Parquet file for the scored rows")
+    parser.add_argument("--models", default="models", help="Directory with model.pkl and outlier_detector.pkl")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Rows per chunk")
+    parser.add_argument("--mmap-dir", help="Share the arrays of the artifacts between the workers (see load_artifact)")
+    args = parser.parse_args()
+    result = score_file(args.input, args.output, args.models, args.workers, args.chunksize, args.mmap_dir)
+    print(f"{result['rows']} rows in {result['seconds']:.1f} s ({result['rows_per_s']:.0f} rows/s)")
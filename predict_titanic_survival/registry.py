@@ -0,0 +1,172 @@
+"""
+Module for versioned bundles of the model artifacts.
+
+A registry is a directory with one subdirectory per model version, each
+holding the artifacts listed in `ARTIFACTS`. The active version is the one
+named in the file `ACTIVE` of the registry, or else the latest version in
+lexicographic order. Bundles are published from the `models` directory of
+the DVC pipeline and activated with
+
+    python -m predict_titanic_survival.registry publish models models/registry
+    python -m predict_titanic_survival.registry activate models/registry <version>
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import joblib
+from sklearn.pipeline import Pipeline
+
+from predict_titanic_survival.artifacts import load_artifact
+from predict_titanic_survival.cache import artifact_fingerprint
+from predict_titanic_survival.compiled import compile_model
+from predict_titanic_survival.drift import DriftDetector, DriftWindow
+from predict_titanic_survival.outlier import OutlierDetector
+from predict_titanic_survival.startup import Lazy
+from predict_titanic_survival.treeshap import TreeShapExplainer
+
+ARTIFACTS = ["model.pkl", "feat_names.json", "explainer.pkl", "outlier_detector.pkl", "drift_detector.pkl"]
+ACTIVE_FILE = "ACTIVE"
+
+class DriftMonitoring(NamedTuple):
+    detector: DriftDetector
+    share_preprocessing: bool
+    window: DriftWindow
+
+class ModelBundle:
+    """
+    The artifacts of one model version, loaded from `directory`.
+
+    The model and the outlier detector are loaded at construction, the drift
+    detector lazily with `drift` (see `Lazy`). `make_drift_window` creates the
+    `DriftWindow` for the drift detector and `make_explainer_pool` the
+    `ExplainerPool` for the paths of the model and the explainer; the pool is
+    started by the caller. `timer` records the loading times (see
+    `StartupTimer`). Without `version`, the version is derived from the
+    fingerprint of the artifact files.
+    """
+    def __init__(self, directory, make_drift_window, make_explainer_pool, version=None,
+                 mmap_dir=None, timer=None):
+        self.directory = directory
+        self.paths = {name: os.path.join(directory, name) for name in ARTIFACTS}
+        self.fingerprint = artifact_fingerprint(self.paths.values())
+        self.version = version or self.fingerprint[:12]
+        self.mmap_dir = mmap_dir
+        self.make_drift_window = make_drift_window
+        self.timer = timer
+
+        with self._timed("model.pkl"):
+            pipeline = load_artifact(self.paths["model.pkl"], mmap_dir)
+        self.preprocessor = Pipeline(pipeline.steps[:-1])
+        self.classifier = compile_model(pipeline.steps[-1][1])
+        with self._timed("outlier_detector.pkl"):
+            outlier_detector = load_artifact(self.paths["outlier_detector.pkl"], mmap_dir)
+        if isinstance(outlier_detector, Pipeline):
+            # Artifact in the old format: preprocessor and detector in one pipeline
+            outlier_detector = OutlierDetector.from_pipeline(outlier_detector)
+        self.outlier_detector = outlier_detector
+        # Transform the inputs only once if the outlier detector was fitted
+        # on the same preprocessor as the model
+        self.share_preprocessing = outlier_detector.shares_preprocessor(self.preprocessor)
+
+        self.drift = Lazy(self._load_drift_monitoring, on_load=self._record_drift_load)
+
+        with open(self.paths["feat_names.json"], "r") as f:
+            self.feat_names = json.load(f)
+        try:
+            self.tree_explainer = TreeShapExplainer(self.classifier, self.feat_names)
+        except (TypeError, ValueError):
+            self.tree_explainer = None
+        self.explainer_pool = make_explainer_pool(self.paths["model.pkl"], self.paths["explainer.pkl"])
+
+    @contextmanager
+    def _timed(self, name):
+        if self.timer is None:
+            yield
+        else:
+            with self.timer.timed("artifact", name):
+                yield
+
+    def _record_drift_load(self, seconds):
+        if self.timer is not None:
+            self.timer.record("artifact", "drift_detector.pkl", seconds)
+
+    def _load_drift_monitoring(self):
+        drift_detector = load_artifact(self.paths["drift_detector.pkl"], self.mmap_dir)
+        if not isinstance(drift_detector, DriftDetector):
+            raise TypeError(f"{self.paths['drift_detector.pkl']} has an outdated format, "
+                            "rerun the drift_model stage")
+        return DriftMonitoring(
+            drift_detector,
+            joblib.hash(drift_detector.preprocessor) == joblib.hash(self.preprocessor),
+            self.make_drift_window(drift_detector),
+        )
+
+    def warm_up(self, df):
+        """Run `df` through the model and the outlier detector once."""
+        self.classifier.predict_proba(self.preprocessor.transform(df))
+        self.outlier_detector.decision_function(df)
+
+    def close(self):
+        """Stop the drift window and the explainer pool."""
+        if self.drift.loaded:
+            self.drift.get().window.close()
+        self.explainer_pool.stop()
+
+def list_versions(registry_dir):
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if os.path.isfile(os.path.join(registry_dir, name, "model.pkl"))
+    )
+
+def resolve_version(registry_dir):
+    """The active version of the registry (None if it is empty)."""
+    active_path = os.path.join(registry_dir, ACTIVE_FILE)
+    if os.path.exists(active_path):
+        with open(active_path, "r") as f:
+            return f.read().strip()
+    versions = list_versions(registry_dir)
+    return versions[-1] if versions else None
+
+def activate_version(registry_dir, version):
+    if version not in list_versions(registry_dir):
+        raise ValueError(f"Version {version} not found in {registry_dir}")
+    fd, tmp_path = tempfile.mkstemp(dir=registry_dir)
+    with os.fdopen(fd, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(registry_dir, ACTIVE_FILE))
+
+def publish_bundle(models_dir, registry_dir, version=None):
+    """Copy the artifacts in `models_dir` into a new version of the registry."""
+    version = version or datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    os.makedirs(registry_dir, exist_ok=True)
+    if os.path.exists(os.path.join(registry_dir, version)):
+        raise ValueError(f"Version {version} already exists in {registry_dir}")
+    # Copy into a temporary directory first, so the version never appears incomplete
+    tmp_dir = tempfile.mkdtemp(dir=registry_dir, prefix=".")
+    for name in ARTIFACTS:
+        shutil.copy2(os.path.join(models_dir, name), tmp_dir)
+    os.rename(tmp_dir, os.path.join(registry_dir, version))
+    return version
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_parser = commands.add_parser("publish", help="Publish the artifacts as new version")
+    publish_parser.add_argument("models_dir")
+    publish_parser.add_argument("registry_dir")
+    publish_parser.add_argument("--version")
+    activate_parser = commands.add_parser("activate", help="Activate a version")
+    activate_parser.add_argument("registry_dir")
+    activate_parser.add_argument("version")
+    args = parser.parse_args()
+    if args.command == "publish":
+        print(publish_bundle(args.models_dir, args.registry_dir, args.version))
+    else:
+        activate_version(args.registry_dir, args.version)
@@ -0,0 +1,26 @@
+"""
+Module for the input data model of the model API.
+"""
+
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+class EmbarkedEnum(str, Enum):
+    cherbourg = 'C'
+    queenstown = 'Q'
+    southampton = 'S'
+    not_given = ''
+
+class Input(BaseModel):
+    pclass: int = Field(example=1, description="Passenger Class")
+    name: str = Field(example="Johanna, Miss. Smith", description="Passenger Name")
+    sex: str = Field(example="female", description="Sex")
+    age: float = Field(example=15.0, description="Age")
+    sibsp: int = Field(example=3, description="Number of Siblings/Spouses Aboard")
+    parch: int = Field(example=2, description="Number of Parents/Children Aboard")
+    ticket: str = Field(example="24160", description="Ticket Number")
+    fare: float = Field(example=211.3375, description="Passenger Fare")
+    cabin: str = Field(example="B5", description="Cabin")
+    embarked: EmbarkedEnum = Field(example="S", description="Port of Embarkation")
+    home_dest: str = Field(alias="home.dest", example="Montreal, PQ / Chesterville, ON", description="Heimat/Ziel")
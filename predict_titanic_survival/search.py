@@ -0,0 +1,293 @@
+"""
+Module for the hyperparameter search and the fairness mitigation of the model.
+"""
+
+import copy
+import os
+import tempfile
+import time
+from abc import ABCMeta, abstractmethod
+from collections.abc import Mapping
+
+import joblib
+import numpy as np
+import pandas as pd
+from fairlearn.reductions import GridSearch
+from fairlearn.reductions._grid_search.grid_search import TRADEOFF_OPTIMIZATION
+from fairlearn.reductions._grid_search._grid_generator import _GridGenerator
+from fairlearn.reductions._moments import ClassificationMoment
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.base import BaseEstimator, clone, is_classifier
+from sklearn.dummy import DummyClassifier
+from sklearn.experimental import enable_halving_search_cv # pylint: disable=unused-import
+from sklearn.model_selection import GridSearchCV, HalvingRandomSearchCV, check_cv
+from sklearn.pipeline import Pipeline
+from sklearn.utils import _safe_indexing
+
+def _index_fit_params(fit_params, n_samples, indices):
+    """`fit_params` with the per-sample values restricted to `indices`."""
+    return {
+        name: _safe_indexing(value, indices) if hasattr(value, "__len__") and len(value) == n_samples else value
+        for name, value in fit_params.items()
+    }
+
+def _transform_fold(preprocessor, X, y, train, test, fit_params):
+    """Fit `preprocessor` on the rows `train` and transform the rows `train` and `test`."""
+    X_train = preprocessor.fit_transform(
+        _safe_indexing(X, train), _safe_indexing(y, train), **_index_fit_params(fit_params, len(X), train))
+    return X_train, preprocessor.transform(_safe_indexing(X, test))
+
+class _CachedPreprocessingSearchCV(BaseEstimator, metaclass=ABCMeta):
+    """
+    Base class of the searches over the parameters of the final step of a
+    pipeline, which fit the preprocessing steps only once per fold.
+
+    The preprocessing is fitted on the training rows of each fold, and the
+    transformed folds are stacked into one memory-mapped matrix, on which a
+    search of the final step (see `_make_search`) runs with the same
+    train/test splits. The parallel workers share the pages of this matrix,
+    and the time of the search grows with the number of classifier fits
+    only.
+
+    `best_params_`, `best_score_`, `best_index_` and `cv_results_` use the
+    parameter names of the pipeline; `best_estimator_` is the pipeline
+    refitted with `best_params_` on all data.
+    """
+    def _final_step_params(self, params):
+        """`params` (a dict or list of dicts) with the names of the final step, without its prefix."""
+        name = self.estimator.steps[-1][0]
+        final_params = []
+        for grid in [params] if isinstance(params, Mapping) else params:
+            for param in grid:
+                if not param.startswith(name + "__"):
+                    raise ValueError(f"Only parameters of the final step '{name}' can be searched, got {param}")
+            final_params.append({param[len(name) + 2:]: values for param, values in grid.items()})
+        return final_params
+
+    @abstractmethod
+    def _make_search(self, final_estimator, cv):
+        """The unfitted search of `final_estimator` with the splits `cv`, with `refit=False`."""
+
+    def fit(self, X, y, **fit_params):
+        """
+        Search the parameters with cross validation on `X` and `y`. The
+        `fit_params` are routed as by `Pipeline.fit`, per-sample values are
+        split along with the folds.
+        """
+        name = self.estimator.steps[-1][0]
+        final_fit_params = {param[len(name) + 2:]: value for param, value in fit_params.items()
+                            if param.startswith(name + "__")}
+        preprocessing_fit_params = {param: value for param, value in fit_params.items()
+                                    if not param.startswith(name + "__")}
+        preprocessor = Pipeline(self.estimator.steps[:-1])
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        splits = list(cv.split(X, y))
+
+        folds = Parallel(n_jobs=self.n_jobs)(
+            delayed(_transform_fold)(clone(preprocessor), X, y, train, test, preprocessing_fit_params)
+            for train, test in splits)
+
+        # Train and test rows of all folds one after the other, with the
+        # indices of each fold into the stacked rows
+        indices = np.concatenate([np.concatenate([train, test]) for train, test in splits])
+        stacked_cv = []
+        start = 0
+        for train, test in splits:
+            stacked_cv.append((np.arange(start, start + len(train)),
+                               np.arange(start + len(train), start + len(train) + len(test))))
+            start += len(train) + len(test)
+        parts = [part for fold in folds for part in fold]
+        X_stacked = sparse.vstack(parts).tocsr() if sparse.issparse(parts[0]) else np.vstack(parts)
+        del folds, parts
+        y_stacked = _safe_indexing(np.asarray(y), indices)
+        final_fit_params = _index_fit_params(final_fit_params, len(X), indices)
+
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as folder:
+            if not sparse.issparse(X_stacked):
+                path = os.path.join(folder, "folds.joblib")
+                joblib.dump(X_stacked, path)
+                X_stacked = joblib.load(path, mmap_mode="r")
+            self.search_ = self._make_search(clone(self.estimator.steps[-1][1]), stacked_cv)
+            self.search_.fit(X_stacked, y_stacked, **final_fit_params)
+            del X_stacked
+
+        self.cv_results_ = {
+            (f"param_{name}__{key[len('param_'):]}" if key.startswith("param_") else key): value
+            for key, value in self.search_.cv_results_.items()
+        }
+        self.cv_results_["params"] = [{f"{name}__{param}": value for param, value in params.items()}
+                                      for params in self.search_.cv_results_["params"]]
+        self.best_index_ = self.search_.best_index_
+        self.best_score_ = self.search_.best_score_
+        self.best_params_ = self.cv_results_["params"][self.best_index_]
+        self.n_splits_ = len(splits)
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y, **fit_params)
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def predict_proba(self, X):
+        return self.best_estimator_.predict_proba(X)
+
+class CachedPreprocessingGridSearchCV(_CachedPreprocessingSearchCV):
+    """
+    Grid search over the parameters of the final step of a pipeline, which
+    fits the preprocessing steps only once per fold (see
+    `_CachedPreprocessingSearchCV`).
+
+    Gives the same results as `GridSearchCV(estimator, param_grid, ...)` if
+    `param_grid` only contains parameters of the final step.
+    """
+    def __init__(self, estimator, param_grid, scoring=None, n_jobs=None, cv=None, cache_dir=None):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.cv = cv
+        self.cache_dir = cache_dir
+
+    def _make_search(self, final_estimator, cv):
+        return GridSearchCV(final_estimator, self._final_step_params(self.param_grid), scoring=self.scoring,
+                            n_jobs=self.n_jobs, cv=cv, refit=False)
+
+class CachedPreprocessingHalvingSearchCV(_CachedPreprocessingSearchCV):
+    """
+    Successive halving search over random candidates of the parameters of
+    the final step of a pipeline, which fits the preprocessing steps only
+    once per fold (see `_CachedPreprocessingSearchCV`).
+
+    All `n_candidates` candidates drawn from `param_distributions` are
+    evaluated with `min_resources` of the `resource`, e.g. `clf__n_estimators`
+    or `n_samples`; the best `1/factor` of them are evaluated again with
+    `factor` times the resource, until `max_resources` is reached (see
+    `HalvingRandomSearchCV`). With `n_samples`, the training and test rows
+    of each fold are subsampled, while the preprocessing is always fitted on
+    all training rows of the fold.
+
+    With `clf__n_estimators` as resource, each fit costs about as much as
+    its trees plus a fixed cost of about five trees (input validation,
+    init estimator, scoring). The first round alone fits every candidate
+    on every fold, so a search takes at least `n_candidates` fixed costs
+    per fold, however few trees it starts with. It is faster than a grid
+    with `max_resources` trees per point once the grid has more points
+    than the search costs in units of such a point (about 8 for 100
+    candidates, factor 10 and 1 to 100 trees); for smaller grids, use
+    `CachedPreprocessingGridSearchCV`.
+    """
+    def __init__(self, estimator, param_distributions, n_candidates="exhaust", factor=3,
+                 resource="n_samples", max_resources="auto", min_resources="exhaust",
+                 aggressive_elimination=False, scoring=None, n_jobs=None, cv=None, random_state=None,
+                 cache_dir=None):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.n_candidates = n_candidates
+        self.factor = factor
+        self.resource = resource
+        self.max_resources = max_resources
+        self.min_resources = min_resources
+        self.aggressive_elimination = aggressive_elimination
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.cv = cv
+        self.random_state = random_state
+        self.cache_dir = cache_dir
+
+    def _make_search(self, final_estimator, cv):
+        resource = self.resource
+        if resource != "n_samples":
+            resource = next(iter(self._final_step_params({resource: None})[0]))
+        return HalvingRandomSearchCV(
+            final_estimator, self._final_step_params(self.param_distributions), n_candidates=self.n_candidates,
+            factor=self.factor, resource=resource, max_resources=self.max_resources,
+            min_resources=self.min_resources, aggressive_elimination=self.aggressive_elimination,
+            scoring=self.scoring, n_jobs=self.n_jobs, cv=cv, refit=False, random_state=self.random_state)
+
+def _fit_grid_point(estimator, X, y, sample_weight_name, weights):
+    start = time.time()
+    estimator.fit(X, y, **{sample_weight_name: weights})
+    return estimator, time.time() - start
+
+class ParallelGridSearch(GridSearch):
+    """
+    fairlearn `GridSearch`, which fits the estimators of the Lagrange
+    multipliers of the grid in `n_jobs` parallel processes.
+
+    A numpy feature matrix is memory-mapped from a temporary file in
+    `cache_dir`, so the processes share its pages. For an estimator with a
+    fixed `random_state`, `lambda_vecs_`, `objectives_`, `gammas_`,
+    `predictors_` and `best_idx_` are the same as those of `GridSearch`;
+    `oracle_execution_times_` holds the fit time of each grid point.
+    """
+    def __init__(self, estimator, constraints, selection_rule=TRADEOFF_OPTIMIZATION, constraint_weight=0.5,
+                 grid_size=10, grid_limit=2.0, grid_offset=None, grid=None, sample_weight_name="sample_weight",
+                 n_jobs=None, cache_dir=None):
+        super().__init__(estimator, constraints, selection_rule=selection_rule,
+                         constraint_weight=constraint_weight, grid_size=grid_size, grid_limit=grid_limit,
+                         grid_offset=grid_offset, grid=grid, sample_weight_name=sample_weight_name)
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+
+    def _reductions(self, X, y, **kwargs):
+        """The grid and per grid point the estimator, relabelled `y` and weights (as in `GridSearch.fit`)."""
+        self.constraints.load_data(X, y, **kwargs)
+        objective = self.constraints.default_objective()
+        objective.load_data(X, y, **kwargs)
+        objective_in_the_span = self.constraints.default_objective_lambda_vec is not None
+        if self.grid is None:
+            grid = _GridGenerator(
+                self.grid_size, self.grid_limit, self.constraints.pos_basis, self.constraints.neg_basis,
+                self.constraints.neg_basis_present, objective_in_the_span, self.grid_offset,
+            ).grid
+        else:
+            grid = self.grid
+
+        reductions = []
+        for i in grid.columns:
+            weights = self.constraints.signed_weights(grid[i])
+            if not objective_in_the_span:
+                weights = weights + objective.signed_weights()
+            if isinstance(self.constraints, ClassificationMoment):
+                y_reduction = 1 * (weights > 0)
+                weights = weights.abs()
+            else:
+                y_reduction = self.constraints._y_as_series # pylint: disable=protected-access
+            y_reduction_unique = np.unique(y_reduction)
+            if len(y_reduction_unique) == 1:
+                estimator = DummyClassifier(strategy="constant", constant=y_reduction_unique[0])
+            else:
+                estimator = copy.deepcopy(self.estimator)
+            reductions.append((estimator, y_reduction, weights))
+        return grid, objective, reductions
+
+    def fit(self, X, y, **kwargs):
+        """Run the grid search in parallel, `sensitive_features` are required as for `GridSearch.fit`."""
+        grid, objective, reductions = self._reductions(X, y, **kwargs)
+
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as folder:
+            X_shared = X
+            if isinstance(X, np.ndarray):
+                path = os.path.join(folder, "X.joblib")
+                joblib.dump(X, path)
+                X_shared = joblib.load(path, mmap_mode="r")
+            fitted = Parallel(n_jobs=self.n_jobs)(
+                delayed(_fit_grid_point)(estimator, X_shared, y_reduction, self.sample_weight_name, weights)
+                for estimator, y_reduction, weights in reductions)
+            del X_shared
+
+        self.predictors_ = [estimator for estimator, _ in fitted]
+        self.oracle_execution_times_ = [seconds for _, seconds in fitted]
+        self.lambda_vecs_ = pd.DataFrame(dtype=np.float64)
+        self.objectives_ = []
+        self.gammas_ = pd.DataFrame(dtype=np.float64)
+        for i, estimator in zip(grid.columns, self.predictors_):
+            self.lambda_vecs_[i] = grid[i]
+            self.objectives_.append(objective.gamma(estimator.predict)[0])
+            self.gammas_[i] = self.constraints.gamma(estimator.predict)
+
+        losses = [self.objective_weight * self.objectives_[i]
+                  + self.constraint_weight * self.gammas_[grid.columns[i]].max()
+                  for i in range(len(self.objectives_))]
+        self.best_idx_ = losses.index(min(losses))
+        return self
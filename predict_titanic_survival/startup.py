@@ -0,0 +1,73 @@
+"""
+Module for timing and deferring the startup of the model API.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from threading import Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """
+    Records the duration of startup steps by kind (e.g. "import",
+    "artifact") and name. `export` writes them to a Prometheus gauge with
+    the labels `kind` and `name`; steps recorded later are written directly.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+        self._gauge = None
+
+    @contextmanager
+    def timed(self, kind, name):
+        start = time.perf_counter()
+        yield
+        self.record(kind, name, time.perf_counter() - start)
+
+    def record(self, kind, name, seconds):
+        self.durations[(kind, name)] = seconds
+        if self._gauge is not None:
+            self._gauge.labels(kind, name).set(seconds)
+
+    def since_start(self):
+        return time.perf_counter() - self.start
+
+    def export(self, gauge):
+        self._gauge = gauge
+        for (kind, name), seconds in self.durations.items():
+            gauge.labels(kind, name).set(seconds)
+
+class Lazy:
+    """
+    Value created by `load` on first use of `get`, or beforehand in a
+    background thread with `load_in_background`. `on_load` is called with
+    the loading time in seconds.
+    """
+    def __init__(self, load, on_load=None):
+        self.load = load
+        self.on_load = on_load
+        self.loaded = False
+        self._value = None
+        self._lock = Lock()
+
+    def get(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    start = time.perf_counter()
+                    self._value = self.load()
+                    self.loaded = True
+                    if self.on_load is not None:
+                        self.on_load(time.perf_counter() - start)
+        return self._value
+
+    def load_in_background(self):
+        Thread(target=self._load_logged, daemon=True).start()
+
+    def _load_logged(self):
+        try:
+            self.get()
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Loading in the background failed")
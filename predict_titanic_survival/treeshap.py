@@ -0,0 +1,123 @@
+"""
+Module for exact explanations of gradient boosted trees.
+"""
+
+from math import factorial
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier
+
+from predict_titanic_survival.compiled import CompiledTreeEnsemble
+
+class TreeShapExplainer:
+    """
+    Exact SHAP values of a binary `GradientBoostingClassifier` (or of the
+    best predictor of a fairlearn `GridSearch`) with the path-dependent
+    feature perturbation of TreeSHAP. The contributions are given on the
+    log-odds scale of the positive class and add up to the decision function
+    minus its expectation over the training data.
+
+    Each leaf of the ensemble contributes a product game: with o_j whether
+    the input satisfies all splits on feature j along the path to the leaf
+    and z_j the fraction of the training weight that follows these splits,
+    the expected leaf value given the features S is
+    value * prod_{j in S} o_j * prod_{j not in S} z_j. The paths of all
+    leaves are extracted once, the Shapley values of these games are then
+    computed for all leaves at once with numpy.
+    """
+    def __init__(self, model, feature_names):
+        self.feature_names = list(feature_names)
+        self.gbc = self._get_gbc(model)
+        self._extract_paths()
+
+    @staticmethod
+    def _get_gbc(model):
+        if hasattr(model, "predictors_") and hasattr(model, "best_idx_"):
+            # fairlearn GridSearch predicts with its best predictor
+            model = model.predictors_[model.best_idx_]
+        if isinstance(model, CompiledTreeEnsemble):
+            model = model.estimator
+        if not isinstance(model, GradientBoostingClassifier):
+            raise TypeError(f"{type(model).__name__} is not a GradientBoostingClassifier")
+        if model.estimators_.shape[1] != 1:
+            raise ValueError("Only binary classifiers are supported")
+        return model
+
+    def _extract_paths(self):
+        leaves = []
+        for estimator in self.gbc.estimators_[:, 0]:
+            tree = estimator.tree_
+            value = tree.value[:, 0, 0] * self.gbc.learning_rate
+            stack = [(0, [], {})]
+            while stack:
+                node, edges, fractions = stack.pop()
+                if tree.children_left[node] == -1:
+                    leaves.append((value[node], edges, fractions))
+                    continue
+                feature, threshold = tree.feature[node], tree.threshold[node]
+                for child, goes_left in ((tree.children_left[node], True),
+                                         (tree.children_right[node], False)):
+                    fraction = tree.weighted_n_node_samples[child] / tree.weighted_n_node_samples[node]
+                    stack.append((
+                        child,
+                        edges + [(feature, threshold, goes_left)],
+                        {**fractions, feature: fractions.get(feature, 1.) * fraction},
+                    ))
+
+        n_leaves = len(leaves)
+        n_edges = max(len(edges) for _, edges, _ in leaves)
+        n_slots = max(max(len(fractions) for _, _, fractions in leaves), 1)
+        self.values = np.array([value for value, _, _ in leaves])
+        # Splits along the paths, padded with splits every input satisfies
+        self.edge_feature = np.zeros((n_leaves, n_edges), dtype=int)
+        self.edge_threshold = np.full((n_leaves, n_edges), np.inf)
+        self.edge_left = np.ones((n_leaves, n_edges), dtype=bool)
+        self.edge_slot = np.full((n_leaves, n_edges), -1)
+        # Features along the paths, padded with null players (o = z = 1)
+        self.zero_fractions = np.ones((n_leaves, n_slots))
+        self.slot_features = np.zeros((n_leaves * n_slots, len(self.feature_names)))
+        for leaf, (_, edges, fractions) in enumerate(leaves):
+            slots = {feature: slot for slot, feature in enumerate(fractions)}
+            for edge, (feature, threshold, goes_left) in enumerate(edges):
+                self.edge_feature[leaf, edge] = feature
+                self.edge_threshold[leaf, edge] = threshold
+                self.edge_left[leaf, edge] = goes_left
+                self.edge_slot[leaf, edge] = slots[feature]
+            for feature, slot in slots.items():
+                self.zero_fractions[leaf, slot] = fractions[feature]
+                self.slot_features[leaf * n_slots + slot, feature] = 1.
+        self.shapley_weights = [
+            factorial(k) * factorial(n_slots - k - 1) / factorial(n_slots) for k in range(n_slots)]
+
+    def shap_values(self, X):
+        """SHAP values as array (n_samples, n_features)."""
+        # The trees compare the features in single precision
+        X = np.asarray(X, dtype=np.float32)
+        satisfied = (X[:, self.edge_feature] <= self.edge_threshold) == self.edge_left
+        n_slots = self.zero_fractions.shape[1]
+        one = np.stack([
+            np.all(satisfied | (self.edge_slot != slot), axis=2) for slot in range(n_slots)
+        ], axis=2).astype(float)
+        zero = self.zero_fractions
+
+        phi = np.empty_like(one)
+        for i in range(n_slots):
+            # coefficients[k]: sum over the coalitions S of k other features
+            # of prod_{j in S} o_j * prod_{j not in S} z_j
+            coefficients = [np.ones(one.shape[:2])]
+            for j in range(n_slots):
+                if j == i:
+                    continue
+                coefficients = [coefficients[0] * zero[:, j]] + [
+                    coefficients[k] * zero[:, j] + coefficients[k - 1] * one[:, :, j]
+                    for k in range(1, len(coefficients))
+                ] + [coefficients[-1] * one[:, :, j]]
+            weighted = sum(w * c for w, c in zip(self.shapley_weights, coefficients))
+            phi[:, :, i] = self.values * (one[:, :, i] - zero[:, i]) * weighted
+        return phi.reshape(len(X), -1) @ self.slot_features
+
+    def explain(self, x):
+        """List of (feature name, contribution) for one sample, by decreasing magnitude."""
+        contributions = self.shap_values(np.asarray(x)[None, :])[0]
+        order = np.argsort(-np.abs(contributions), kind="stable")
+        return [(self.feature_names[feat], float(contributions[feat])) for feat in order]
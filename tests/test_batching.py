@@ -0,0 +1,55 @@
+import asyncio
+
+from predict_titanic_survival.batching import MicroBatcher
+
+def test_no_record_lost_when_flooded_at_max_wait():
+    async def flood():
+        loop = asyncio.get_running_loop()
+        batcher = MicroBatcher(lambda records: records, max_batch_size=4, max_wait=0.001)
+        batcher.start()
+        submitted = {}
+        def submit(record):
+            submitted[record] = asyncio.ensure_future(batcher.submit(record))
+        try:
+            for burst in range(200):
+                submit((burst, 0))
+                # Further records arrive just when the batcher stops waiting for them
+                for i in range(1, 6):
+                    loop.call_later(batcher.max_wait * (1 + (i - 3) * .01), submit, (burst, i))
+                await asyncio.sleep(batcher.max_wait)
+            await asyncio.sleep(10 * batcher.max_wait)
+            results = await asyncio.wait_for(asyncio.gather(*submitted.values()), 5)
+        finally:
+            await batcher.stop()
+        assert results == list(submitted)
+
+    asyncio.run(flood())
+
+def test_scores_in_batches():
+    async def submit_all():
+        batches = []
+        def score_batch(records):
+            batches.append(records)
+            return [record * 2 for record in records]
+        batcher = MicroBatcher(score_batch, max_batch_size=4, max_wait=0.01)
+        batcher.start()
+        try:
+            results = await asyncio.gather(*(batcher.submit(record) for record in range(10)))
+        finally:
+            await batcher.stop()
+        assert results == [record * 2 for record in range(10)]
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+
+    asyncio.run(submit_all())
+
+def test_pending_get_kept_after_timeout():
+    async def timeout_then_put():
+        batcher = MicroBatcher(lambda records: records)
+        batcher._queue = asyncio.Queue()
+        assert await batcher._next(0) is None
+        pending = batcher._get
+        batcher._queue.put_nowait("record")
+        assert await batcher._next(0.1) == "record"
+        assert pending.done() and not pending.cancelled()
+
+    asyncio.run(timeout_then_put())
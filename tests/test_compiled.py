@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import GradientBoostingClassifier
+
+from predict_titanic_survival.compiled import CompiledTreeEnsemble
+
+def fitted(n_classes=2, **params):
+    X, y = make_classification(n_samples=400, n_features=8, n_informative=5, n_classes=n_classes,
+                               random_state=0)
+    return GradientBoostingClassifier(random_state=0, **params).fit(X, y), X
+
+@pytest.mark.parametrize("n_classes, params", [
+    (2, {}),
+    (2, {"init": "zero"}),
+    (2, {"loss": "exponential"}),
+    (2, {"max_depth": 6, "n_estimators": 50}),
+    (3, {"n_estimators": 50}),
+])
+def test_same_as_sklearn_for_small_batches(n_classes, params):
+    estimator, X = fitted(n_classes, **params)
+    compiled = CompiledTreeEnsemble(estimator, max_rows=64)
+    for batch_size in range(1, compiled.max_rows + 1):
+        for start in range(0, 128, batch_size):
+            batch = X[start:start + batch_size]
+            raw = compiled.raw_predict(batch)
+            np.testing.assert_array_equal(raw.ravel() if n_classes == 2 else raw, estimator.decision_function(batch))
+            np.testing.assert_array_equal(compiled.predict_proba(batch), estimator.predict_proba(batch))
+            np.testing.assert_array_equal(compiled.predict(batch), estimator.predict(batch))
+
+def test_large_batches_predicted_by_the_classifier():
+    estimator, X = fitted()
+    compiled = CompiledTreeEnsemble(estimator, max_rows=32)
+    np.testing.assert_array_equal(compiled.predict_proba(X), estimator.predict_proba(X))
+
+def test_calibrated_to_the_measured_crossover():
+    estimator, X = fitted()
+    compiled = CompiledTreeEnsemble(estimator).calibrate(X)
+    assert compiled.max_rows in (0,) + CompiledTreeEnsemble.crossover_batch_sizes
+    # Single rows skip the input validation and the loop over the trees
+    assert compiled.max_rows >= 1
+    np.testing.assert_array_equal(compiled.predict_proba(X), estimator.predict_proba(X))
+    np.testing.assert_array_equal(compiled.predict_proba(X[:compiled.max_rows]),
+                                  estimator.predict_proba(X[:compiled.max_rows]))
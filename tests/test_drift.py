@@ -0,0 +1,48 @@
+import pickle
+
+import numpy as np
+import pytest
+from scipy.stats import chi2_contingency, ks_2samp
+from sklearn.preprocessing import FunctionTransformer
+
+from predict_titanic_survival.drift import DriftDetector
+
+CATEGORICAL = [2, 3]
+
+def numeric_and_categorical_data(n, random_state, shift=0.):
+    """Two numeric columns with ties and two categorical columns (codes)."""
+    rng = np.random.RandomState(random_state)
+    return np.c_[rng.normal(shift, 1, n).round(1), rng.randint(0, 8, n) * 10., rng.randint(0, 3, n),
+                 rng.binomial(1, .3 + shift / 4, n)]
+
+def detector(X_train):
+    return DriftDetector(X_train, FunctionTransformer(), ["a", "b", "c", "d"], CATEGORICAL)
+
+def scipy_p_values(X_train, X):
+    p_values = []
+    for feat in range(X.shape[1]):
+        if feat in CATEGORICAL:
+            categories = np.union1d(X_train[:, feat], X[:, feat])
+            table = [[np.sum(data[:, feat] == category) for category in categories] for data in (X_train, X)]
+            p_values.append(chi2_contingency(table)[1] if len(categories) > 1 else 1.)
+        else:
+            p_values.append(ks_2samp(X_train[:, feat], X[:, feat]).pvalue)
+    return p_values
+
+@pytest.mark.parametrize("n, shift", [(1, 0.), (5, 0.), (100, 0.), (100, .5), (1000, 1.)])
+def test_same_p_values_as_scipy(n, shift):
+    X_train, X = numeric_and_categorical_data(500, 0), numeric_and_categorical_data(n, 1, shift)
+    np.testing.assert_array_equal(detector(X_train).test(X), scipy_p_values(X_train, X))
+
+def test_same_p_values_as_scipy_for_large_reference():
+    # Asymptotic distribution of the KS statistic for more than 10000 values
+    X_train, X = numeric_and_categorical_data(12000, 0), numeric_and_categorical_data(300, 1, .1)
+    np.testing.assert_array_equal(detector(X_train).test(X), scipy_p_values(X_train, X))
+
+def test_unpickles_old_detector_with_p_value_cache():
+    X_train, X = numeric_and_categorical_data(500, 0), numeric_and_categorical_data(100, 1)
+    drift_detector = detector(X_train)
+    drift_detector._ks_p_values = {(1, 500, 1, 100): 0.}
+    restored = pickle.loads(pickle.dumps(drift_detector))
+    assert not hasattr(restored, "_ks_p_values")
+    assert restored.test(X) == detector(X_train).test(X)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from sklearn.impute import KNNImputer
+from sklearn.metrics.pairwise import nan_euclidean_distances
+
+from predict_titanic_survival.impute import IndexedKNNImputer, _nan_euclidean_exact
+
+def integer_data_with_nans(n, random_state):
+    """Integer-valued columns (many tied distances) with missing values."""
+    rng = np.random.RandomState(random_state)
+    X = np.c_[rng.randint(0, 3, n), rng.randint(0, 3, n), rng.randint(1, 4, n), rng.randint(0, 2, n),
+              rng.randint(0, 8, n) * 10.]
+    X[rng.rand(*X.shape) < .15] = np.nan
+    return X
+
+def exact_metric(x, y, missing_values=np.nan): # pylint: disable=unused-argument
+    return _nan_euclidean_exact(x[np.newaxis], y[np.newaxis])[0, 0]
+
+def exact_knn_imputer(**params):
+    """`KNNImputer` with exactly computed nan-euclidean distances, the reference of `IndexedKNNImputer`."""
+    return KNNImputer(metric=exact_metric, **params)
+
+def assert_same_imputation(actual, expected):
+    # The (weighted) means of the same donors may be rounded differently
+    np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-12)
+
+def test_exact_distances():
+    X, Y = integer_data_with_nans(20, 0), integer_data_with_nans(30, 1)
+    np.testing.assert_allclose(_nan_euclidean_exact(X, Y),
+                               [[nan_euclidean_distances(x[None], y[None])[0, 0] for y in Y] for x in X])
+
+@pytest.mark.parametrize("weights", ["uniform", "distance"])
+@pytest.mark.parametrize("n_neighbors", [1, 5])
+def test_same_as_knn_imputer_with_exact_distances(weights, n_neighbors):
+    X_train, X_test = integer_data_with_nans(300, 0), integer_data_with_nans(200, 1)
+    expected = exact_knn_imputer(n_neighbors=n_neighbors, weights=weights).fit(X_train).transform(X_test)
+    imputer = IndexedKNNImputer(n_neighbors=n_neighbors, weights=weights).fit(X_train)
+    assert_same_imputation(imputer.transform(X_test), expected)
+
+def test_same_as_knn_imputer_with_exact_distances_on_training_data():
+    X_train = integer_data_with_nans(300, 2)
+    expected = exact_knn_imputer().fit(X_train).transform(X_train)
+    assert_same_imputation(IndexedKNNImputer().fit(X_train).transform(X_train), expected)
+
+def test_too_few_donors():
+    X_train = np.array([[1., np.nan], [2., 3.], [np.nan, 4.]])
+    X_test = np.array([[np.nan, 1.], [1.5, np.nan], [2., 2.]])
+    expected = exact_knn_imputer(n_neighbors=5).fit(X_train).transform(X_test)
+    assert_same_imputation(IndexedKNNImputer(n_neighbors=5).fit(X_train).transform(X_test), expected)
+
+def test_independent_of_the_batch():
+    X_train, X_test = integer_data_with_nans(300, 0), integer_data_with_nans(200, 1)
+    imputer = IndexedKNNImputer().fit(X_train)
+    np.testing.assert_array_equal(np.vstack([imputer.transform(row[None]) for row in X_test]),
+                                  imputer.transform(X_test))
+
+@pytest.mark.parametrize("random_state", range(5))
+def test_differs_from_knn_imputer_only_within_its_distance_error(random_state):
+    # KNNImputer may pick another donor where the k-th and (k+1)-th distance
+    # differ by less than the error of its distances (matrix products)
+    X_train, X_test = integer_data_with_nans(300, random_state), integer_data_with_nans(200, random_state + 100)
+    expected = KNNImputer().fit(X_train).transform(X_test)
+    actual = IndexedKNNImputer().fit(X_train).transform(X_test)
+    for row, col in zip(*np.nonzero(~np.isclose(actual, expected, rtol=1e-12, atol=1e-12))):
+        donors = ~np.isnan(X_train[:, col])
+        exact = _nan_euclidean_exact(X_test[[row]], X_train[donors])[0]
+        # As KNNImputer, for all rows with missing values at once
+        missing = np.isnan(X_test).any(axis=1)
+        batch = nan_euclidean_distances(X_test[missing], X_train)[np.flatnonzero(missing) == row][0, donors]
+        error = np.nanmax(np.abs(batch - exact))
+        sorted_exact = np.sort(exact[~np.isnan(exact)])
+        assert sorted_exact[5] - sorted_exact[4] <= 2 * error
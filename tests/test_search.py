@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fairlearn.reductions import ErrorRateParity, GridSearch
+from sklearn.datasets import make_classification
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.experimental import enable_halving_search_cv # pylint: disable=unused-import
+from sklearn.model_selection import GridSearchCV, HalvingRandomSearchCV
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from predict_titanic_survival.search import (
+    CachedPreprocessingGridSearchCV, CachedPreprocessingHalvingSearchCV, ParallelGridSearch,
+    _CachedPreprocessingSearchCV)
+
+def weighted_classification_data(n=300, random_state=0):
+    """Binary classification data with random sample weights."""
+    X, y = make_classification(n_samples=n, n_features=6, n_informative=4, random_state=random_state)
+    sample_weight = np.random.RandomState(random_state).uniform(.5, 2, n)
+    return X, y, sample_weight
+
+def pipeline():
+    return Pipeline([("scaler", StandardScaler()), ("clf", GradientBoostingClassifier(random_state=0))])
+
+PARAM_GRID = {"clf__n_estimators": [5, 20], "clf__max_depth": [1, 3]}
+
+def test_same_as_grid_search_cv():
+    X, y, sample_weight = weighted_classification_data()
+    expected = GridSearchCV(pipeline(), PARAM_GRID, scoring="roc_auc", cv=3).fit(
+        X, y, clf__sample_weight=sample_weight)
+    search = CachedPreprocessingGridSearchCV(pipeline(), PARAM_GRID, scoring="roc_auc", cv=3).fit(
+        X, y, clf__sample_weight=sample_weight)
+    assert search.cv_results_["params"] == expected.cv_results_["params"]
+    for key in ("mean_test_score", "std_test_score", "rank_test_score", "split0_test_score",
+                "param_clf__n_estimators"):
+        np.testing.assert_array_equal(search.cv_results_[key], expected.cv_results_[key])
+    assert search.best_params_ == expected.best_params_
+    assert search.best_score_ == expected.best_score_
+    np.testing.assert_array_equal(search.predict_proba(X), expected.predict_proba(X))
+
+def test_same_as_halving_random_search_cv():
+    X, y, sample_weight = weighted_classification_data()
+    param_distributions = {"clf__max_depth": [1, 2, 3], "clf__learning_rate": [.05, .1, .3]}
+    params = dict(n_candidates=9, factor=3, resource="clf__n_estimators", min_resources=2, max_resources=18,
+                  scoring="accuracy", cv=3, random_state=0)
+    expected = HalvingRandomSearchCV(pipeline(), param_distributions, **params).fit(
+        X, y, clf__sample_weight=sample_weight)
+    search = CachedPreprocessingHalvingSearchCV(pipeline(), param_distributions, **params).fit(
+        X, y, clf__sample_weight=sample_weight)
+    assert search.cv_results_["params"] == expected.cv_results_["params"]
+    np.testing.assert_array_equal(search.cv_results_["mean_test_score"], expected.cv_results_["mean_test_score"])
+    assert search.best_params_ == expected.best_params_
+    np.testing.assert_array_equal(search.predict_proba(X), expected.predict_proba(X))
+
+def test_only_final_step_parameters():
+    X, y, _ = weighted_classification_data()
+    with pytest.raises(ValueError, match="final step"):
+        CachedPreprocessingGridSearchCV(pipeline(), {"scaler__with_mean": [True, False]}).fit(X, y)
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        _CachedPreprocessingSearchCV() # pylint: disable=abstract-class-instantiated
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_same_as_fairlearn_grid_search(n_jobs):
+    X, y, _ = weighted_classification_data()
+    sensitive_features = pd.Series(np.where(X[:, 0] > 0, "male", "female"))
+    estimator = GradientBoostingClassifier(n_estimators=20, random_state=0)
+    expected = GridSearch(estimator, ErrorRateParity(), grid_size=5)
+    expected.fit(X, y, sensitive_features=sensitive_features)
+    search = ParallelGridSearch(estimator, ErrorRateParity(), grid_size=5, n_jobs=n_jobs).fit(
+        X, y, sensitive_features=sensitive_features)
+    pd.testing.assert_frame_equal(search.lambda_vecs_, expected.lambda_vecs_)
+    pd.testing.assert_frame_equal(search.gammas_, expected.gammas_)
+    np.testing.assert_array_equal(search.objectives_, expected.objectives_)
+    assert search.best_idx_ == expected.best_idx_
+    assert len(search.predictors_) == len(expected.predictors_)
+    np.testing.assert_array_equal(search.predict_proba(X), expected.predict_proba(X))